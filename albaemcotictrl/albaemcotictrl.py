@@ -4,12 +4,33 @@
 """Sardana Controller for the AlbaEM#."""
 
 # import logging
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+from multiprocessing.pool import ThreadPool
+
+import numpy
 import PyTango
 
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import zmq
+except ImportError:
+    zmq = None
+
 # from sardana import pool
 # from sardana.pool import PoolUtil
 from sardana.pool.controller import CounterTimerController
 # from sardana.pool import AcqTriggerType
+from sardana.pool import AcqSynch
 
 from sardana import DataAccess
 from sardana.pool.controller import NotMemorized  # MemorizedNoInit,
@@ -35,6 +56,1765 @@ ALBAEM_STATE_MAP = {
                     'STATE_RUNNING': State.On
                     }
 
+# Max nr of electrometers driven by one controller
+MAX_ELECTROMETERS = 8
+
+# Attributes holding the acquired buffer of each one of the 4 channels
+CHANNEL_ATTRIBUTES = ['CurrentCh{}'.format(i) for i in range(1, 5)]
+
+# Attribute holding the buffers of the 4 channels
+MEAS_ATTRIBUTE = 'Meas'
+# Attributes transferring buffers, read with a longer timeout
+BUFFER_ATTRIBUTES = CHANNEL_ATTRIBUTES + [MEAS_ATTRIBUTE]
+
+# Attributes read in only one round trip by ReadAll
+READ_STATE_ATTRIBUTES = ['AcqState', 'Status', 'NData']
+# Attributes never excluded from the bulk reads, even if the device rejects
+# them, see AlbaemProxy.ReadAttributes()
+REQUIRED_ATTRIBUTES = frozenset(READ_STATE_ATTRIBUTES + CHANNEL_ATTRIBUTES)
+READ_ALL_ATTRIBUTES = READ_STATE_ATTRIBUTES + CHANNEL_ATTRIBUTES
+# Attributes read instead when the buffers are given as strings, see
+# AlbaemProxy._ExtractChannels()
+READ_MEAS_ATTRIBUTES = READ_STATE_ATTRIBUTES + [MEAS_ATTRIBUTE]
+
+# Reductions of the samples of a point to the value given by each channel
+REDUCTIONS = {
+              'last': lambda samples: samples[-1],
+              'mean': numpy.mean,
+              'median': numpy.median,
+              }
+
+# Statistics (std, min, max and nr of samples) of a point without samples
+NO_STATISTICS = (float('nan'), float('nan'), float('nan'), 0)
+
+# Configuration attributes cached by AlbaemProxy.WriteConfig()
+CONFIG_ATTRIBUTES = ['AcqTime', 'TriggerMode', 'BufferSize'] + \
+    ['{0}{1}'.format(prefix, i)
+     for prefix in ('CARangeCh', 'CAFilterCh', 'CAInversionCh')
+     for i in range(1, 5)]
+
+# Trigger modes of the device, by the names given by the TriggerMode attribute
+TRIGGER_MODES = {
+                 'software': 'SOFTWARE',
+                 'hardware': 'HARDWARE',
+                 'gate': 'GATE',
+                 }
+
+# Trigger mode used for each one of the Sardana synchronizations
+SYNCHRONIZATION_MODES = {
+                         AcqSynch.SoftwareTrigger: 'SOFTWARE',
+                         AcqSynch.SoftwareGate: 'SOFTWARE',
+                         AcqSynch.HardwareTrigger: 'HARDWARE',
+                         AcqSynch.HardwareGate: 'GATE',
+                         }
+
+# Min and max time (in s) during which an unreachable device is not called
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+
+# Kinds of calls to a device, each one with its own proxy and timeout: the
+# buffers transfers can last much more than the rest of the calls
+CONTROL = 'control'
+DATA = 'data'
+# Time (in s) added to the timeout of the buffers transfers by each sample
+DATA_TIMEOUT_PER_SAMPLE = 1e-5
+
+# Calls that can be retried once if they time out
+RETRIED_METHODS = frozenset(['__getitem__', 'read_attribute',
+                             'read_attributes', 'status', 'state'])
+
+# Reasons of the Tango errors meaning that the device is not reachable
+CONNECTION_ERRORS = frozenset(['API_CantConnectToDevice',
+                               'API_CommunicationFailed',
+                               'API_CorbaException',
+                               'API_DeviceNotExported',
+                               'API_DeviceTimedOut',
+                               'API_ServerNotRunning',
+                               'API_DeviceNotReachable'])
+
+# Period (in s) used to poll the state while prefetching the readings
+PREFETCH_PERIOD = 0.01
+# Max time (in s) that ReadAll waits for an ongoing prefetch
+PREFETCH_TIMEOUT = 1.0
+
+
+def parse_samples(text):
+    """
+    Parse the comma separated samples of a buffer given as a string.
+
+    numpy stops parsing at the first invalid sample, but if it is the last
+    one it gives -1 or the valid part of it (e.g. 3.2 for '3.2e-'), so the
+    last one is parsed again by python.
+
+    :return: numpy array of floats, or None if the text can not be parsed.
+    """
+    if not text:
+        return numpy.empty(0)
+    try:
+        float(text[text.rfind(',') + 1:])
+    except ValueError:
+        return None
+    samples = numpy.fromstring(text, sep=',')
+    if len(samples) != text.count(',') + 1:
+        return None
+    return samples
+
+
+def decode_buffer(values):
+    """
+    Convert the buffer of a channel into a numpy array of floats.
+
+    Depending on the version of the device server the buffer is given as a
+    numeric array (DevVarDoubleArray) or as a string like '[1.0, 2.0]\\r'.
+    Numeric arrays are not copied and strings are parsed in C by numpy
+    without building intermediate python lists.
+
+    >>> decode_buffer('[1.0, 2, -3e-9]\\r').tolist()
+    [1.0, 2.0, -3e-09]
+    >>> decode_buffer('[]').tolist()
+    []
+    >>> decode_buffer('[1.0, x, 3]')
+    Traceback (most recent call last):
+    ...
+    ValueError: Buffer can not be parsed: [1.0, x, 3]
+    >>> for values in ('[5, x]', '[5, -]', '[5, .]', '[5, +]', '[5, e]',
+    ...                '[5, n]', '[5, 3.2e-]', '[5, ]'):
+    ...     try:
+    ...         decode_buffer(values)
+    ...     except ValueError as exc:
+    ...         print(exc)
+    Buffer can not be parsed: [5, x]
+    Buffer can not be parsed: [5, -]
+    Buffer can not be parsed: [5, .]
+    Buffer can not be parsed: [5, +]
+    Buffer can not be parsed: [5, e]
+    Buffer can not be parsed: [5, n]
+    Buffer can not be parsed: [5, 3.2e-]
+    Buffer can not be parsed: [5, ]
+    >>> decode_buffer('[5, nan, -inf]').tolist()
+    [5.0, nan, -inf]
+
+    :raise ValueError: if the string can not be parsed.
+    """
+    if values is None:
+        return numpy.empty(0)
+    if isinstance(values, basestring):
+        samples = parse_samples(values.strip('[]\r\n '))
+        if samples is None:
+            raise ValueError('Buffer can not be parsed: {0}'.format(
+                Abbreviated(values)))
+        return samples
+    return numpy.asarray(values, dtype=numpy.float64)
+
+
+def decode_meas(meas):
+    """
+    Convert the Meas attribute into the numpy arrays of the 4 channels.
+
+    Meas is like [['CHAN01', '[1.0, 2.0]'], ['CHAN02', '[...]'], ...]. The
+    channels are identified by their name, and all of them are parsed by
+    numpy at once. The returned arrays are views of the same array.
+
+    >>> meas = [['CHAN02', '[3, 4]\\r'], ['CHAN01', '[1.5, 2]'],
+    ...         ['CHAN03', '[]'], ['CHAN04', '[5]']]
+    >>> [buff.tolist() for buff in decode_meas(meas)]
+    [[1.5, 2.0], [3.0, 4.0], [], [5.0]]
+    >>> decode_meas(meas[:3])
+    Traceback (most recent call last):
+    ...
+    ValueError: Channels missing in Meas: ['CHAN02', 'CHAN01', 'CHAN03']
+    >>> decode_meas(meas[:3] + [['CHAN05', '[5]']])
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown channel in Meas: CHAN05
+    >>> decode_meas(meas[:3] + [['TEMP', '[5]']])
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown channel in Meas: TEMP
+    >>> for values in ('[5, x]', '[5, -]', '[5, 3.2e-]'):
+    ...     try:
+    ...         decode_meas(meas[:3] + [['CHAN04', values]])
+    ...     except ValueError as exc:
+    ...         print(str(exc)[:22])
+    Meas can not be parsed
+    Meas can not be parsed
+    Meas can not be parsed
+    >>> decode_meas(meas[:2] + [['CHAN04', '[5]'], ['CHAN03', '[-]']])
+    ... # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+    ...
+    ValueError: Meas can not be parsed: ...
+
+    :raise ValueError: if a channel is missing, unknown or can not be
+                       parsed.
+    """
+    buffers = [None, None, None, None]
+    for name, values in meas:
+        name = name.strip()
+        if not name.startswith('CHAN') or \
+                name[4:] not in ('01', '02', '03', '04'):
+            raise ValueError('Unknown channel in Meas: {0}'.format(name))
+        buffers[int(name[4:]) - 1] = values
+    if None in buffers:
+        raise ValueError('Channels missing in Meas: {0}'.format(
+            [name for name, _ in meas]))
+    if not all(isinstance(values, basestring) for values in buffers):
+        return [decode_buffer(values) for values in buffers]
+    texts = [values.strip('[]\r\n ') for values in buffers]
+    lengths = [text.count(',') + 1 if text else 0 for text in texts]
+    # NOTE: an invalid last sample of a channel stops the parsing, unless
+    # it is the last one of all, see parse_samples().
+    samples = parse_samples(','.join(text for text in texts if text))
+    if samples is None:
+        raise ValueError('Meas can not be parsed: {0}'.format(
+            Abbreviated(meas)))
+    return numpy.split(samples, numpy.cumsum(lengths)[:-1])
+
+
+def reduce_samples(samples, reduction):
+    """
+    Reduce the samples of a point to one value (see REDUCTIONS).
+
+    :return: the value, or None if there are no samples.
+    """
+    if not len(samples):
+        return None
+    return float(REDUCTIONS[reduction](samples))
+
+
+def describe_samples(samples):
+    """
+    Return the statistics of the samples of a point.
+
+    :return: tuple (std, min, max, nr of samples), NaN if there are no
+             samples.
+    """
+    if not len(samples):
+        return NO_STATISTICS
+    return (float(numpy.std(samples)), float(numpy.min(samples)),
+            float(numpy.max(samples)), len(samples))
+
+
+class Abbreviated(object):
+    """
+    Lazy and truncated string representation of a buffer, for the logs.
+
+    The conversion to string is only done if the message is really logged,
+    and big buffers are truncated to their beginning and end.
+    """
+
+    MAX_LENGTH = 100
+
+    def __init__(self, values):
+        self._values = values
+
+    def __str__(self):
+        text = str(self._values)
+        if len(text) <= self.MAX_LENGTH:
+            return text
+        half = self.MAX_LENGTH // 2
+        return '{0} ... {1} ({2} chars)'.format(text[:half], text[-half:],
+                                                 len(text))
+
+
+class RingBuffer(object):
+    """
+    Fixed capacity buffer of floats keeping the last samples of a channel.
+
+    The storage is preallocated and every sample is written twice, at i and
+    at i + capacity, so the last n samples (n <= capacity) are always a
+    contiguous region of the array. This allows to give them to the readers
+    as a read-only numpy view, without copying them. The view keeps a
+    reference to the storage, but its contents are overwritten by the next
+    appends once the buffer wraps around.
+
+    >>> buff = RingBuffer(3)
+    >>> buff.append(numpy.array([1., 2.]))
+    >>> buff.append(numpy.array([3., 4.]))
+    >>> buff.view().tolist(), buff.view(2).tolist(), buff.count, len(buff)
+    ([2.0, 3.0, 4.0], [3.0, 4.0], 4, 3)
+    >>> buff.append(numpy.arange(5.))
+    >>> buff.view(10).tolist(), buff.last()
+    ([2.0, 3.0, 4.0], 4.0)
+    >>> buff.reserve(5)
+    >>> buff.append(numpy.array([5., 6.]))
+    >>> buff.view().tolist(), buff.count
+    ([2.0, 3.0, 4.0, 5.0, 6.0], 11)
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = numpy.zeros(2 * capacity)
+        # Position where the next sample will be written.
+        self._head = 0
+        # Total nr of samples appended since the last clear.
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        self._head = 0
+        self.count = 0
+
+    def append(self, samples):
+        """Append an array of samples, dropping the oldest ones."""
+        nr_of_samples = len(samples)
+        samples = samples[-self.capacity:]
+        head, capacity = self._head, self.capacity
+        size = len(samples)
+        first = min(size, capacity - head)
+        for offset in (0, capacity):
+            self._data[offset + head:offset + head + first] = samples[:first]
+            self._data[offset:offset + size - first] = samples[first:]
+        self._head = (head + size) % capacity
+        self.count += nr_of_samples
+
+    def reserve(self, capacity):
+        """Increase the capacity, keeping the samples."""
+        if capacity <= self.capacity:
+            return
+        samples, count = self.view().copy(), self.count
+        self.__init__(capacity)
+        self.append(samples)
+        self.count = count
+
+    def view(self, nr_of_samples=None):
+        """Return the last samples as a read-only view of the storage."""
+        if nr_of_samples is None or nr_of_samples > len(self):
+            nr_of_samples = len(self)
+        end = self._head + self.capacity
+        data = self._data[end - nr_of_samples:end]
+        data.flags.writeable = False
+        return data
+
+    def last(self):
+        """Return the last sample, None if the buffer is empty."""
+        if self.count == 0:
+            return None
+        return float(self._data[self._head - 1 + self.capacity])
+
+
+class Decimator(object):
+    """
+    Reduction of every block of consecutive samples of a channel to their
+    mean, standard deviation, min and max.
+
+    The samples are given in chunks of any size, and the blocks completed
+    are reduced at once. Only the samples of the incomplete block are kept
+    between chunks, so the memory used does not depend on the nr of samples
+    acquired.
+
+    :param factor: nr of samples of every block.
+    """
+
+    def __init__(self, factor):
+        self.factor = factor
+        self._pending = numpy.empty(0)
+
+    def clear(self):
+        self._pending = numpy.empty(0)
+
+    def push(self, samples):
+        """
+        Add samples and reduce the blocks completed.
+
+        :return: tuple of arrays (mean, std, min, max), with one value per
+                 block completed.
+        """
+        samples = numpy.concatenate((self._pending, samples))
+        nr_of_blocks = len(samples) // self.factor
+        end = nr_of_blocks * self.factor
+        # NOTE: copied to not keep a reference to the whole chunk.
+        self._pending = samples[end:].copy()
+        blocks = samples[:end].reshape(nr_of_blocks, self.factor)
+        return (blocks.mean(axis=1), blocks.std(axis=1), blocks.min(axis=1),
+                blocks.max(axis=1))
+
+
+class ValueRefWriter(object):
+    """
+    Writer of the buffers of an acquisition to files referred by URIs.
+
+    The pattern is the URI of the files, where {name} (device name),
+    {session} (time when the writer was created, like 20240131-235959),
+    {index} (nr of the acquisition since then) and {channel} (1 to 4) are
+    replaced:
+
+    - 'h5file:///path/{name}_{session}_{index}.h5': one HDF5 file per
+      acquisition, with the datasets CurrentCh1 to CurrentCh4. The
+      references are like 'h5file:///path/file.h5::CurrentCh1'. It needs
+      h5py.
+    - 'file:///path/{name}_{session}_{index}_{channel}.npy': one .npy file
+      per channel, which can be read without copying it with
+      numpy.load(path, mmap_mode='r').
+
+    The index starts again when the controller is restarted, so existing
+    files are never overwritten: the acquisitions referred by them could
+    still be read.
+
+    :raise ValueError: if the pattern is not supported.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.session = time.strftime('%Y%m%d-%H%M%S')
+        self.hdf5 = pattern.startswith('h5file://')
+        if self.hdf5:
+            if h5py is None:
+                raise ValueError('h5py is needed by {0}'.format(pattern))
+        elif not pattern.startswith('file://') or \
+                not pattern.endswith('.npy') or '{channel' not in pattern:
+            raise ValueError('{0} is not a h5file:// URI, nor a file:// URI '
+                             'of .npy files by {{channel}}'.format(pattern))
+
+    def _Path(self, uri):
+        return uri.split('://', 1)[1]
+
+    def _Save(self, path, save):
+        """
+        Write a file atomically, so it is never read half written.
+
+        :raise RuntimeError: if the file already exists.
+        """
+        if os.path.exists(path):
+            raise RuntimeError('{0} already exists and it is not overwritten, '
+                               'add {{session}} to the pattern {1}'.format(
+                                   path, self.pattern))
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_path = path + '.tmp'
+        save(tmp_path)
+        os.rename(tmp_path, path)
+
+    def Write(self, name, index, buffers):
+        """
+        Write the buffers of the 4 channels.
+
+        :return: list with the reference of each channel.
+        :raise RuntimeError: if one of the files already exists.
+        """
+        name = name.replace('/', '_')
+        fields = dict(name=name, session=self.session, index=index)
+        if self.hdf5:
+            uri = self.pattern.format(channel=0, **fields)
+
+            def save(path):
+                with h5py.File(path, 'w') as h5file:
+                    for attr, buff in zip(CHANNEL_ATTRIBUTES, buffers):
+                        h5file.create_dataset(attr, data=buff)
+            self._Save(self._Path(uri), save)
+            return ['{0}::{1}'.format(uri, attr)
+                    for attr in CHANNEL_ATTRIBUTES]
+        refs = []
+        for channel, buff in enumerate(buffers, 1):
+            uri = self.pattern.format(channel=channel, **fields)
+
+            # NOTE: numpy.save would add .npy to the temporary file name.
+            def save(path, buff=buff):
+                with open(path, 'wb') as npy_file:
+                    numpy.save(npy_file, buff)
+            self._Save(self._Path(uri), save)
+            refs.append(uri)
+        return refs
+
+
+class StreamPublisher(object):
+    """
+    Publisher of the rows acquired by the electrometers, as soon as they are
+    read, so the consumers (e.g. live views) do not need to poll the pool.
+
+    The rows are given to the local subscribers (see Subscribe()) and, if
+    the URI is a ZeroMQ endpoint (e.g. 'tcp://*:5555', or
+    'ipc:///tmp/albaem' for a Unix domain socket), published in a PUB
+    socket as multipart messages with:
+
+    - the electrometer name, to filter by it.
+    - a JSON header with the name, acquisition (nr of the acquisition),
+      first_row (index of the first row), rows (nr of rows), dtype and
+      channels (attribute names of the columns).
+    - the estimated time of each row, as float64.
+    - the rows, as a C-ordered (rows, 4) array of float64.
+
+    With 'local://' there are only local subscribers. The messages are
+    never queued beyond SEND_HWM: slow consumers lose messages, instead of
+    slowing the acquisition.
+
+    :raise ValueError: if the URI is not supported.
+    """
+
+    SEND_HWM = 100
+
+    def __init__(self, uri, log):
+        self.uri = uri
+        self._log = log
+        self._subscribers = []
+        self._socket = None
+        if uri == 'local://':
+            return
+        if not uri.startswith(('tcp://', 'ipc://')):
+            raise ValueError('{0} is not a tcp:// or ipc:// URI, nor '
+                             'local://'.format(uri))
+        if zmq is None:
+            raise ValueError('pyzmq is needed by {0}'.format(uri))
+        self._socket = zmq.Context.instance().socket(zmq.PUB)
+        self._socket.setsockopt(zmq.SNDHWM, self.SEND_HWM)
+        self._socket.setsockopt(zmq.LINGER, 0)
+        self._socket.bind(uri)
+
+    def Subscribe(self, callback):
+        """
+        Call a function with every chunk of rows published, as
+        callback(name, acquisition, first_row, timestamps, rows).
+
+        It is called from the thread reading the electrometers, so it must
+        return quickly.
+        """
+        self._subscribers.append(callback)
+
+    def Unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def Publish(self, name, acquisition, first_row, timestamps, channels):
+        """
+        Publish a chunk of rows of an electrometer.
+
+        :param channels: the new samples of each one of the 4 channels.
+        """
+        timestamps = numpy.array(timestamps, dtype=numpy.float64)
+        rows = numpy.column_stack(channels).astype(numpy.float64)
+        for callback in list(self._subscribers):
+            try:
+                callback(name, acquisition, first_row, timestamps, rows)
+            except Exception as exc:
+                self._log.warning('Publish(): subscriber %s failed: %s',
+                                  callback, exc)
+        if self._socket is None:
+            return
+        header = json.dumps({'name': name, 'acquisition': acquisition,
+                             'first_row': first_row, 'rows': len(rows),
+                             'dtype': 'float64',
+                             'channels': CHANNEL_ATTRIBUTES})
+        try:
+            self._socket.send_multipart([name.encode('utf-8'), header,
+                                         timestamps.tostring(),
+                                         rows.tostring()], zmq.NOBLOCK)
+        except zmq.Again:
+            self._log.debug('Publish(): chunk of %s dropped', name)
+
+    def Close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class Statistics(object):
+    """
+    Counters and latency histograms of the calls done by the controller.
+
+    The latencies are accumulated in histograms with fixed bins, so the
+    memory used does not grow with the nr of calls.
+    """
+
+    # Upper edges (in s) of the histogram bins, the last bin is unbounded.
+    BINS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+            0.1, 0.2, 0.5, 1, 2, 5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {key: [count, total time, max time, histogram]}
+        self._entries = {}
+
+    def Measure(self, key):
+        """Return a context manager recording the duration of a call."""
+        return _Measurement(self, key)
+
+    def Record(self, key, duration):
+        index = bisect.bisect_left(self.BINS, duration)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = [0, 0.0, 0.0, [0] * (len(self.BINS) + 1)]
+                self._entries[key] = entry
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+            entry[3][index] += 1
+
+    def Reset(self):
+        with self._lock:
+            self._entries = {}
+
+    def _Percentile(self, histogram, count, percentile):
+        """Return the upper edge of the bin where the percentile falls."""
+        accumulated = 0
+        for index, nr_of_calls in enumerate(histogram):
+            accumulated += nr_of_calls
+            if accumulated * 100 >= count * percentile:
+                break
+        if index < len(self.BINS):
+            return self.BINS[index]
+        return float('inf')
+
+    def Summary(self):
+        """Return one line per key with its counters, times in ms."""
+        lines = []
+        with self._lock:
+            for key in sorted(self._entries):
+                count, total, max_time, histogram = self._entries[key]
+                p50 = self._Percentile(histogram, count, 50)
+                p99 = self._Percentile(histogram, count, 99)
+                lines.append('{0}: count={1} mean={2:.3f} p50<={3:g} '
+                             'p99<={4:g} max={5:.3f}'.format(
+                                key, count, total / count * 1000, p50 * 1000,
+                                p99 * 1000, max_time * 1000))
+        return '\n'.join(lines)
+
+
+class _Measurement(object):
+
+    def __init__(self, statistics, key):
+        self._statistics = statistics
+        self._key = key
+
+    def __enter__(self):
+        self._start = time.time()
+
+    def __exit__(self, *exc_info):
+        self._statistics.Record(self._key, time.time() - self._start)
+
+
+class _NoMeasurement(object):
+    """Context manager used when the instrumentation is disabled."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NO_MEASUREMENT = _NoMeasurement()
+
+
+class InstrumentedDevice(object):
+    """
+    Wrapper of a PyTango.DeviceProxy recording the round trips done.
+
+    The keys start with the device name, so a slow electrometer can be
+    spotted when the controller drives several of them.
+    """
+
+    def __init__(self, device, statistics, name):
+        self._device = device
+        self._statistics = statistics
+        self._name = name
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+    def _Measure(self, access):
+        return self._statistics.Measure('{0} {1}'.format(self._name, access))
+
+    def __getitem__(self, name):
+        with self._Measure('read ' + name):
+            return self._device[name]
+
+    def __setitem__(self, name, value):
+        with self._Measure('write ' + name):
+            self._device[name] = value
+
+    def read_attributes(self, names, *args, **kwargs):
+        with self._Measure('read_attributes ' + ','.join(names)):
+            return self._device.read_attributes(names, *args, **kwargs)
+
+    def write_attributes(self, name_values, *args, **kwargs):
+        names = ','.join(name for name, _ in name_values)
+        with self._Measure('write_attributes ' + names):
+            return self._device.write_attributes(name_values, *args,
+                                                 **kwargs)
+
+    def status(self, *args, **kwargs):
+        with self._Measure('status'):
+            return self._device.status(*args, **kwargs)
+
+    def command_inout(self, name, *args, **kwargs):
+        with self._Measure('command ' + name):
+            return self._device.command_inout(name, *args, **kwargs)
+
+
+def is_timeout(exc):
+    return any(getattr(error, 'reason', None) == 'API_DeviceTimedOut'
+               for error in exc.args)
+
+
+def is_attr_not_found(exc):
+    return any(getattr(error, 'reason', None) == 'API_AttrNotFound'
+               for error in exc.args)
+
+
+def is_connection_error(exc):
+    """Check if a PyTango.DevFailed means that the device is unreachable."""
+    if isinstance(exc, (PyTango.ConnectionFailed,
+                        PyTango.CommunicationFailed)):
+        return True
+    return any(getattr(error, 'reason', None) in CONNECTION_ERRORS
+               for error in exc.args)
+
+
+class Connection(object):
+    """
+    Connection to one device, shared by all the controllers, see
+    ConnectionManager.
+
+    The calls are done through views (see View()) used like a
+    PyTango.DeviceProxy. There is one proxy by kind of calls (CONTROL or
+    DATA), created on its first call, so each kind has its own timeout:
+    the longest one requested by the users of the connection, see
+    SetTimeout(). The reads that time out are retried once.
+
+    After a connection error the calls fail at once, without waiting for
+    the Tango timeout, until the reconnect delay is over. The delay is
+    doubled after every consecutive error. The timeouts of the DATA calls
+    are not connection errors, since the buffers transfers can be slow.
+
+    The listeners are notified (calling their OnReconnect() method) when
+    the device is reachable again.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._proxies = {}
+        # Timeouts requested by each user, by kind of calls, and the ones
+        # used.
+        self._requested_timeouts = {}
+        self._timeouts = {}
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._retry_time = 0
+        self._listeners = weakref.WeakSet()
+
+    def AddListener(self, listener):
+        self._listeners.add(listener)
+
+    def View(self, kind=CONTROL):
+        return ConnectionView(self, kind)
+
+    def SetTimeout(self, kind, timeout, user):
+        """
+        Set the timeout (in s) of a kind of calls requested by a user of the
+        connection (e.g. an AlbaemProxy).
+
+        The longest timeout requested by the users still alive is used, so
+        the calls of a user never time out before the user expects.
+        """
+        with self._lock:
+            requested = self._requested_timeouts.setdefault(
+                kind, weakref.WeakKeyDictionary())
+            requested[user] = timeout
+            timeout = max(requested.values())
+            if self._timeouts.get(kind) == timeout:
+                return
+            self._timeouts[kind] = timeout
+            proxy = self._proxies.get(kind)
+        if proxy is not None:
+            proxy.set_timeout_millis(int(timeout * 1000))
+
+    def IsReachable(self):
+        return not self._failures or time.time() >= self._retry_time
+
+    def GetProxy(self, kind=CONTROL):
+        with self._lock:
+            if not self.IsReachable():
+                PyTango.Except.throw_exception(
+                    'API_DeviceNotReachable',
+                    '{0} is not reachable, next retry in {1:.1f} s'.format(
+                        self.name, self._retry_time - time.time()),
+                    'Connection.GetProxy')
+            proxy = self._proxies.get(kind)
+            if proxy is None:
+                try:
+                    proxy = PyTango.DeviceProxy(self.name)
+                except PyTango.DevFailed:
+                    self._Failed()
+                    raise
+                if kind in self._timeouts:
+                    proxy.set_timeout_millis(int(self._timeouts[kind] * 1000))
+                self._proxies[kind] = proxy
+            return proxy
+
+    def _Failed(self):
+        self._failures += 1
+        delay = RECONNECT_MIN_DELAY * 2 ** (self._failures - 1)
+        self._retry_time = time.time() + min(delay, RECONNECT_MAX_DELAY)
+
+    def Call(self, kind, method, *args, **kwargs):
+        """Call a method of the DeviceProxy of a kind of calls."""
+        proxy = self.GetProxy(kind)
+        retry = method in RETRIED_METHODS
+        while True:
+            try:
+                result = getattr(proxy, method)(*args, **kwargs)
+                break
+            except PyTango.DevFailed as exc:
+                if retry and is_timeout(exc):
+                    retry = False
+                    continue
+                # NOTE: a DATA call can time out because the transfer is
+                # slow, so it does not block the CONTROL calls.
+                slow_transfer = kind == DATA and is_timeout(exc)
+                if is_connection_error(exc) and not slow_transfer:
+                    with self._lock:
+                        self._Failed()
+                if is_timeout(exc):
+                    PyTango.Except.re_throw_exception(
+                        exc, 'API_DeviceTimedOut',
+                        '{0}: {1} ({2} call) timed out after {3} s'.format(
+                            self.name, method.strip('_'), kind,
+                            self._timeouts.get(kind)),
+                        'Connection.Call')
+                raise
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+            for listener in list(self._listeners):
+                listener.OnReconnect()
+        return result
+
+
+class ConnectionView(object):
+    """Calls of one kind to a Connection, used like a PyTango.DeviceProxy."""
+
+    def __init__(self, connection, kind):
+        self._connection = connection
+        self._kind = kind
+
+    def GetProxy(self):
+        return self._connection.GetProxy(self._kind)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return functools.partial(self._connection.Call, self._kind, name)
+
+    def __getitem__(self, name):
+        return self._connection.Call(self._kind, '__getitem__', name)
+
+    def __setitem__(self, name, value):
+        self._connection.Call(self._kind, '__setitem__', name, value)
+
+
+class ConnectionManager(object):
+    """
+    Connections to the devices, one per device name.
+
+    There is only one instance, CONNECTIONS, so the controllers of the same
+    pool process share the connections.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def GetConnection(self, name):
+        with self._lock:
+            key = name.lower()
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = self._connections[key] = Connection(name)
+            return connection
+
+
+CONNECTIONS = ConnectionManager()
+
+
+class AlbaemProxy(object):
+    """
+    Communication with one AlbaEM# device server.
+
+    It keeps the state, the change events subscriptions and the buffers of
+    the 4 channels of one electrometer, so one controller can drive several
+    electrometers.
+
+    Nothing is read from the device until it is used, and the connection
+    is shared with the other controllers, see ConnectionManager.
+    """
+
+    def __init__(self, name, log, buffer_capacity, state_cache_time,
+                 config_cache_time, control_timeout, use_events, prefetch,
+                 reduction='last', statistics=None):
+        self.name = name
+        self._log = log
+        self.reduction = reduction
+        self.state_cache_time = state_cache_time
+        self.config_cache_time = config_cache_time
+        self.control_timeout = control_timeout
+        self.use_events = use_events
+        self.prefetch = prefetch
+
+        self.state = None
+        self.status = ''
+        # Time when the state was read, 0 means that it must be read again.
+        self._state_timestamp = 0
+        # The state and the nr of triggers can be updated by the change
+        # events, which are received in another thread.
+        self._state_lock = threading.Lock()
+        self._event_ids = []
+        self._events_alive = False
+        self._ndata = None
+        # The subscription is done on the first read of the state.
+        self._events_pending = use_events
+
+        # Attributes rejected by the device, excluded from the bulk reads.
+        self._unreadable_attributes = set()
+        # The buffers are read from the Meas attribute, see
+        # _ExtractChannels().
+        self._uses_meas = False
+
+        # Last rows acquired by each channel: the samples, or the mean of
+        # each block of samples if they are decimated.
+        self.buffers = [RingBuffer(buffer_capacity)
+                        for _ in CHANNEL_ATTRIBUTES]
+        # Nr of samples of each channel already read from the device. Only
+        # the samples acquired after the cursor are read on the next read.
+        self._cursors = [0, 0, 0, 0]
+        # Nr of rows of each channel already given by the Data attribute,
+        # see ReadData(). They are still given by ReadAll and the other way
+        # around.
+        self._data_cursors = [0, 0, 0, 0]
+        # Nr of samples reduced to each row, see SetDecimation(). When it is
+        # more than 1, the std, min and max of the blocks are also kept.
+        self.buffer_capacity = buffer_capacity
+        self.decimation = 1
+        self._decimators = None
+        self.spreads = None
+        # Rows (the samples of the 4 channels of the same trigger) given to
+        # the pool, and the ones given by the last ReadAll, see EmitRows().
+        self._emitted_rows = 0
+        self.new_rows = 0
+        # Estimated time of each emitted row, and of the last emission.
+        self.timestamps = RingBuffer(buffer_capacity)
+        self._emission_time = time.time()
+        # Value of each channel in the last point, see reduce_samples(), and
+        # its statistics, see describe_samples().
+        self.values = [None, None, None, None]
+        self.point_statistics = [NO_STATISTICS] * 4
+        # Nr of acquisitions started, and references to the files with the
+        # buffers of the last one, see GetValueRefs().
+        self.acquisition_index = 0
+        self._value_refs = None
+        # Nr of triggers of the acquisition, more than 1 in continuous mode.
+        self.repetitions = 1
+        # BufferSize of the step scans, saved while it is replaced by the
+        # nr of triggers in continuous mode, see GetBufferSize().
+        self._step_buffer_size = None
+
+        # Readings done in background while the acquisition finishes, see
+        # StartPrefetch(). Only the last ones are kept.
+        self._prefetch_thread = None
+        self._prefetch_abort = threading.Event()
+        self._prefetch_reading = False
+        self._prefetched = None
+        # Taken to check the abort before starting the read, so a read is
+        # either aborted before it starts or its values are used.
+        self._prefetch_lock = threading.Lock()
+
+        # Last known configuration of the device, None if it must be read.
+        self._config = None
+        # Time when the configuration was read. While its change events are
+        # received the configuration does not expire.
+        self._config_timestamp = 0
+        self._config_events_alive = False
+        # Trigger mode, it does not expire like the rest of the configuration
+        # since it is only changed by the controller, see GetTriggerMode().
+        self._trigger_mode = None
+
+        self._connection = CONNECTIONS.GetConnection(name)
+        self._connection.AddListener(self)
+        self._connection.SetTimeout(CONTROL, control_timeout, self)
+        self.UpdateDataTimeout()
+        self.device = self._connection.View(CONTROL)
+        # NOTE: the buffers are transferred by another proxy, see
+        # UpdateDataTimeout().
+        self.data_device = self._connection.View(DATA)
+        if statistics is not None:
+            self.device = InstrumentedDevice(self.device, statistics, name)
+            self.data_device = InstrumentedDevice(self.data_device,
+                                                  statistics, name)
+
+    def __getitem__(self, name):
+        return self.device[name]
+
+    def __setitem__(self, name, value):
+        self.device[name] = value
+
+    def ReadStateAndStatus(self):
+        """
+        Read the state of the electrometer if the cached one is too old.
+
+        The status is only read when the state changes.
+        """
+        try:
+            if self._events_pending:
+                self._events_pending = False
+                self.SubscribeEvents()
+            if self.IsStateFresh():
+                if self.status is None:
+                    self.status = self.device.status()
+                return
+            acq_state = self.device['AcqState'].value
+            status = self.status
+            if ALBAEM_STATE_MAP[acq_state.strip()] != self.state or \
+                    status is None:
+                status = self.device.status()
+            self.UpdateState(acq_state, status)
+            self._log.debug('Read state of %s: %s', self.name, self.state)
+        # TODO: Improve the try/except please!
+        except Exception as exc:
+            # NOTE: only logged once while the device is not reachable.
+            if self.state is State.Fault:
+                self._log.debug(exc)
+            else:
+                self._log.error(exc)
+            self.SetFault(exc)
+            # NOTE: the device could have been restarted, so its
+            # configuration must be verified again.
+            self.InvalidateConfig()
+            raise
+
+    def IsStateFresh(self):
+        """
+        Check if the cached state can be used without reading it again.
+
+        While the change events are received the cached state is always up
+        to date, unless it was invalidated.
+        """
+        with self._state_lock:
+            if self._events_alive and self._state_timestamp:
+                return True
+            elapsed = time.time() - self._state_timestamp
+            return elapsed < self.state_cache_time
+
+    def UpdateState(self, acq_state, status):
+        with self._state_lock:
+            self.state = ALBAEM_STATE_MAP[acq_state.strip()]
+            self.status = status
+            self._state_timestamp = time.time()
+
+    def InvalidateState(self):
+        with self._state_lock:
+            self._state_timestamp = 0
+
+    def SetFault(self, exc):
+        with self._state_lock:
+            self.state = State.Fault
+            self.status = '{0} is not available: {1}'.format(self.name, exc)
+            self._state_timestamp = 0
+
+    def OnReconnect(self):
+        """
+        Called when the device is reachable again.
+
+        It could have been restarted, so its state and configuration are
+        read again, and the change events subscribed again if needed.
+        """
+        self._log.info('%s is reachable again', self.name)
+        self.InvalidateState()
+        self.InvalidateConfig()
+        if self.use_events and not self._event_ids:
+            self._events_pending = True
+
+    def SubscribeEvents(self):
+        """
+        Subscribe to the change events of AcqState, NData and the
+        configuration attributes.
+
+        If the device server does not push them, the state and the
+        configuration keep being polled.
+        """
+        try:
+            for name in ('AcqState', 'NData'):
+                event_id = self.device.subscribe_event(
+                    name, PyTango.EventType.CHANGE_EVENT, self._OnEvent)
+                self._event_ids.append(event_id)
+        except PyTango.DevFailed as exc:
+            self._log.warning('SubscribeEvents(): events not available, '
+                              'the state will be polled. Exception: %s', exc)
+            self.UnsubscribeEvents()
+            # NOTE: try again when the device is reachable.
+            if is_connection_error(exc):
+                self._events_pending = True
+            return
+        config_event_ids = []
+        try:
+            for name in CONFIG_ATTRIBUTES:
+                event_id = self.device.subscribe_event(
+                    name, PyTango.EventType.CHANGE_EVENT, self._OnConfigEvent)
+                config_event_ids.append(event_id)
+        except PyTango.DevFailed as exc:
+            self._log.info('SubscribeEvents(): configuration events not '
+                           'available, it will be polled. Exception: %s', exc)
+            for event_id in config_event_ids:
+                self.device.unsubscribe_event(event_id)
+            self._config_events_alive = False
+            return
+        self._event_ids.extend(config_event_ids)
+
+    def UnsubscribeEvents(self):
+        for event_id in self._event_ids:
+            try:
+                self.device.unsubscribe_event(event_id)
+            except PyTango.DevFailed as exc:
+                self._log.warning('UnsubscribeEvents(): %s', exc)
+        self._event_ids = []
+        self._events_alive = False
+        self._config_events_alive = False
+        self._ndata = None
+
+    def _OnEvent(self, event):
+        """
+        Update the state and the nr of triggers from a change event.
+
+        On error events the state is polled until the events come back.
+        """
+        if event.err:
+            self._log.warning('_OnEvent(): error event, the state will be '
+                              'polled. Errors: %s', event.errors)
+            self._events_alive = False
+            return
+        name = event.attr_name.rsplit('/', 1)[-1].lower()
+        value = event.attr_value.value
+        if name == 'acqstate':
+            # NOTE: if the state changed, the status will be read again only
+            # when it is requested.
+            status = self.status
+            if ALBAEM_STATE_MAP[value.strip()] != self.state:
+                status = None
+            self.UpdateState(value, status)
+        elif name == 'ndata':
+            self._ndata = int(value)
+        self._events_alive = True
+
+    def _OnConfigEvent(self, event):
+        """
+        Update the cached configuration from a change event.
+
+        On error events the configuration expires again after
+        config_cache_time.
+        """
+        if event.err:
+            self._log.warning('_OnConfigEvent(): error event, the '
+                              'configuration will be polled. Errors: %s',
+                              event.errors)
+            self._config_events_alive = False
+            return
+        name = event.attr_name.rsplit('/', 1)[-1].lower()
+        config = self._config
+        if config is not None:
+            for attr in CONFIG_ATTRIBUTES:
+                if attr.lower() == name:
+                    config[attr] = str(event.attr_value.value)
+        if name == 'triggermode':
+            self._trigger_mode = str(event.attr_value.value)
+        self._config_events_alive = True
+
+    def ReadAttributes(self, names):
+        """
+        Read several attributes of the electrometer in only one round trip.
+
+        If the device rejects the bulk read, the attributes are read one by
+        one, as well as the ones failed in the bulk read. The ones which do
+        not exist in the running version of the device server are excluded
+        from the next bulk reads, unless they are REQUIRED_ATTRIBUTES.
+
+        :return: dictionary {attribute_name: value} with the attributes read.
+                 The ones which could not be read are missing.
+        """
+        names = [name for name in names
+                 if name not in self._unreadable_attributes]
+        device = self.device
+        if any(name in BUFFER_ATTRIBUTES for name in names):
+            device = self.data_device
+        try:
+            attrs = device.read_attributes(names)
+        except PyTango.DevFailed as exc:
+            if is_connection_error(exc):
+                raise
+            self._log.warning('ReadAttributes(%r): bulk read failed, '
+                              'reading one by one. Exception: %s', names, exc)
+            attrs = [None] * len(names)
+        values = {}
+        for name, attr in zip(names, attrs):
+            if attr is not None and not getattr(attr, 'has_failed', False):
+                values[name] = attr.value
+                continue
+            try:
+                values[name] = device[name].value
+            except PyTango.DevFailed as exc:
+                self._log.error('ReadAttributes(): could not read %s: %s',
+                                name, exc)
+                if is_attr_not_found(exc) and \
+                        name not in REQUIRED_ATTRIBUTES:
+                    self._unreadable_attributes.add(name)
+        return values
+
+    def ReadNewSamples(self, channel, values, ndata=None):
+        """
+        Store the samples of a channel acquired since its last read.
+
+        :param channel: channel index, starting at 0.
+        :param values: buffer of the channel as given by the device.
+        :param ndata: nr of triggers acquired, used to store the same nr of
+                      samples for all the channels.
+        :return: read-only view of the new samples in the channel buffer.
+        """
+        samples = decode_buffer(values)[self._cursors[channel]:ndata]
+        self._cursors[channel] += len(samples)
+        if self._decimators is None:
+            self._AppendRows(channel, samples)
+            return self.buffers[channel].view(len(samples))
+        rows = self._decimators[channel].push(samples)
+        self._AppendRows(channel, *rows)
+        return self.buffers[channel].view(len(rows[0]))
+
+    def _AppendRows(self, channel, means, *spreads):
+        self.buffers[channel].append(means)
+        if self.spreads is not None:
+            for buff, values in zip(self.spreads[channel], spreads):
+                buff.append(values)
+
+    def SetDecimation(self, decimation):
+        """
+        Set the nr of samples of each channel reduced to one row, on the fly
+        while they are read.
+
+        The rows have the mean of the samples, and their std, min and max
+        are kept in spreads. The buffers of the 3 of them are only allocated
+        while the decimation is used.
+        """
+        self.decimation = decimation
+        if decimation == 1:
+            self._decimators = None
+            self.spreads = None
+            return
+        if self._decimators is None or \
+                self._decimators[0].factor != decimation:
+            self._decimators = [Decimator(decimation)
+                                for _ in CHANNEL_ATTRIBUTES]
+        if self.spreads is None:
+            self.spreads = [[RingBuffer(self.buffer_capacity)
+                             for _ in ('std', 'min', 'max')]
+                            for _ in CHANNEL_ATTRIBUTES]
+
+    def ReserveRows(self, rows):
+        """
+        Make room in the buffers for a nr of rows (e.g. the triggers of a
+        continuous acquisition), so none of them is lost between two reads.
+
+        The buffers are never shrunk.
+        """
+        if rows <= self.buffer_capacity:
+            return
+        self.buffer_capacity = rows
+        for buff in self.buffers + [self.timestamps] + \
+                sum(self.spreads or [], []):
+            buff.reserve(rows)
+
+    def ReadChannel(self, channel):
+        """Read the whole buffer of a channel."""
+        return self.data_device[CHANNEL_ATTRIBUTES[channel]].value
+
+    def UpdateDataTimeout(self, nr_of_samples=0):
+        """
+        Set the timeout of the buffers transfers.
+
+        It is the control timeout plus the time needed to transfer the
+        expected nr of samples: the given one (e.g. the last nr of triggers
+        read), or the nr of repetitions, if greater.
+        """
+        nr_of_samples = max(nr_of_samples,
+                            self.repetitions * self.decimation)
+        timeout = self.control_timeout + \
+            nr_of_samples * DATA_TIMEOUT_PER_SAMPLE
+        self._connection.SetTimeout(DATA, timeout, self)
+
+    def ReadPendingSamples(self):
+        """Store the samples of all the channels not read yet."""
+        ndata = self.GetNrOfTriggers()
+        channels = [channel for channel in range(4)
+                    if self._cursors[channel] < ndata]
+        if not channels:
+            return
+        self.UpdateDataTimeout(ndata)
+        values = self.ReadAttributes([CHANNEL_ATTRIBUTES[channel]
+                                      for channel in channels])
+        for channel in channels:
+            # NOTE: the channels not read are read again in the next call.
+            if CHANNEL_ATTRIBUTES[channel] in values:
+                self.ReadNewSamples(channel,
+                                    values[CHANNEL_ATTRIBUTES[channel]], ndata)
+
+    def GetValueRefs(self, writer):
+        """
+        Return the references to the buffers of the last acquisition.
+
+        The buffers are written (only once) when the acquisition is over.
+
+        :param writer: ValueRefWriter used to write them.
+        :return: list with the reference of each channel, or None if the
+                 acquisition is not over.
+        :raise RuntimeError: if the buffers did not keep all the samples.
+        """
+        if self._value_refs is None:
+            self.ReadStateAndStatus()
+            if self.state is State.Moving:
+                return None
+            self.ReadPendingSamples()
+            acquired = self.GetAcquiredRows()
+            if acquired > self.buffer_capacity:
+                raise RuntimeError(
+                    '{0}: {1} samples acquired, but only the last {2} are '
+                    'kept, increase BufferCapacity'.format(
+                        self.name, acquired, self.buffer_capacity))
+            buffers = [buff.view() for buff in self.buffers]
+            self._value_refs = writer.Write(self.name, self.acquisition_index,
+                                            buffers)
+        return self._value_refs
+
+    def GetCompleteRows(self):
+        """Return the nr of rows acquired by all the channels."""
+        return min(buff.count for buff in self.buffers)
+
+    def GetAcquiredRows(self):
+        """Return the nr of rows acquired by any of the channels."""
+        return max(buff.count for buff in self.buffers)
+
+    def PadRows(self, rows):
+        """
+        Complete the channels up to a nr of rows, once the acquisition is
+        over.
+
+        The missing samples are read again and, if they are still missing,
+        flagged as NaN, so the rows are never misaligned.
+        """
+        if self.GetCompleteRows() >= rows:
+            return
+        self.ReadPendingSamples()
+        for channel, buff in enumerate(self.buffers):
+            if buff.count >= rows:
+                continue
+            self._log.warning('%s: %d samples missing in channel %d, '
+                              'flagged as NaN', self.name, rows - buff.count,
+                              channel + 1)
+            missing = numpy.full(rows - buff.count, numpy.nan)
+            self._AppendRows(channel, missing, missing, missing, missing)
+            self._cursors[channel] = max(self._cursors[channel],
+                                         rows * self.decimation)
+
+    def EmitRows(self, rows):
+        """
+        Give to the pool the rows acquired up to a nr of rows.
+
+        Their timestamps are estimated spreading them evenly since the
+        previous emission. If more rows than the buffers capacity were
+        acquired since then, only the last ones are given, so all the
+        channels and the timer give the same nr of values.
+        """
+        new_rows = max(rows - self._emitted_rows, 0)
+        if new_rows > self.buffer_capacity:
+            self._log.warning('%s: %d rows lost, more than the buffers '
+                              'capacity (%d) acquired between two reads',
+                              self.name, new_rows - self.buffer_capacity,
+                              self.buffer_capacity)
+        self.new_rows = min(new_rows, self.buffer_capacity)
+        if not self.new_rows:
+            return
+        now = time.time()
+        self.timestamps.append(numpy.linspace(self._emission_time, now,
+                                              self.new_rows + 1)[1:])
+        self._emission_time = now
+        self._emitted_rows = rows
+
+    def GetFirstNewRow(self):
+        """Return the index of the first row given by the last EmitRows()."""
+        return self._emitted_rows - self.new_rows
+
+    def GetNewRows(self, channel):
+        """
+        Return the samples of a channel in the rows given by the last
+        EmitRows(), as a read-only view.
+        """
+        since_previous = self.buffers[channel].count - \
+            (self._emitted_rows - self.new_rows)
+        return self.buffers[channel].view(since_previous)[:self.new_rows]
+
+    def ReadData(self, channel):
+        """
+        Return the rows of a channel acquired since the last call, as a
+        read-only view.
+
+        The samples not read yet are downloaded and stored as ReadAll()
+        does, but the rows already given are tracked with another cursor,
+        so reading the Data attribute does not take them from the pool.
+        """
+        ndata = self.GetNrOfTriggers()
+        if self._cursors[channel] < ndata:
+            self.UpdateDataTimeout(ndata)
+            self.ReadNewSamples(channel, self.ReadChannel(channel), ndata)
+        buff = self.buffers[channel]
+        new_rows = buff.count - self._data_cursors[channel]
+        self._data_cursors[channel] = buff.count
+        if not new_rows:
+            return numpy.empty(0)
+        return buff.view(new_rows)
+
+    def ResetBuffers(self):
+        self._cursors = [0, 0, 0, 0]
+        self._data_cursors = [0, 0, 0, 0]
+        self._emitted_rows = 0
+        self.new_rows = 0
+        self.timestamps.clear()
+        self._emission_time = time.time()
+        self.values = [None, None, None, None]
+        self.point_statistics = [NO_STATISTICS] * 4
+        self._value_refs = None
+        for buff in self.buffers:
+            buff.clear()
+        if self._decimators is not None:
+            for decimator in self._decimators:
+                decimator.clear()
+            for buff in sum(self.spreads, []):
+                buff.clear()
+
+    def SendSWTrigger(self):
+        if self.GetTriggerMode() == TRIGGER_MODES['software']:
+            self._log.debug('Sending SWTrigger to %s', self.name)
+            self.device['SWTrigger'] = '1'
+
+    def GetConfig(self, name):
+        """
+        Return the value (as string) of a configuration attribute.
+
+        The whole configuration is read from the device in only one round
+        trip when it is older than config_cache_time, and meanwhile it is
+        kept updated by WriteConfig() and the change events.
+        """
+        if not self.IsConfigFresh():
+            values = self.ReadAttributes(CONFIG_ATTRIBUTES)
+            self._config = dict((attr, str(value))
+                                for attr, value in values.items())
+            self._config_timestamp = time.time()
+        return self._config.get(name)
+
+    def GetBufferSize(self, repetitions):
+        """
+        Return the BufferSize to load for a nr of repetitions, None to keep
+        the one of the device.
+
+        In step scans the BufferSize of the device (the nr of samples of
+        each point) is kept. In continuous mode it is the nr of triggers,
+        and the previous one is restored in the next step scan.
+        """
+        if repetitions > 1:
+            if self._step_buffer_size is None:
+                self._step_buffer_size = self.GetConfig('BufferSize')
+            return str(repetitions)
+        buffer_size, self._step_buffer_size = self._step_buffer_size, None
+        return buffer_size
+
+    def GetTriggerMode(self):
+        """
+        Return the trigger mode of the device.
+
+        It is read only once after connecting, and then kept by
+        WriteConfig(), so in hardware modes nothing is read or written in
+        every point until the values.
+        """
+        if self._trigger_mode is None:
+            mode = self.GetConfig('TriggerMode')
+            self._trigger_mode = mode.strip().upper() if mode else None
+        return self._trigger_mode
+
+    def IsConfigFresh(self):
+        if self._config is None:
+            return False
+        if self._config_events_alive:
+            return True
+        elapsed = time.time() - self._config_timestamp
+        return elapsed < self.config_cache_time
+
+    def WriteConfig(self, name, value):
+        """
+        Write a configuration attribute only if its value changes.
+
+        :return: True if the value was written.
+        """
+        value = str(value)
+        if self.GetConfig(name) == value:
+            return False
+        try:
+            self.device[name] = value
+        except PyTango.DevFailed:
+            self.InvalidateConfig()
+            raise
+        # NOTE: the configuration is invalidated if the device reconnects.
+        if self._config is not None:
+            self._config[name] = value
+        if name == 'TriggerMode':
+            self._trigger_mode = value
+        return True
+
+    def WriteConfigs(self, name_values):
+        """
+        Write several configuration attributes in only one round trip.
+
+        Only the values that change are written.
+
+        :param name_values: sequence of (attribute name, value) pairs.
+        :return: nr of values written.
+        """
+        changed = [(name, str(value)) for name, value in name_values
+                   if self.GetConfig(name) != str(value)]
+        if not changed:
+            return 0
+        try:
+            self.device.write_attributes(changed)
+        except PyTango.DevFailed:
+            self.InvalidateConfig()
+            raise
+        if self._config is not None:
+            self._config.update(changed)
+        self._trigger_mode = dict(changed).get('TriggerMode',
+                                               self._trigger_mode)
+        return len(changed)
+
+    def InvalidateConfig(self):
+        self._config = None
+        self._trigger_mode = None
+
+    def GetNrOfTriggers(self):
+        if self._events_alive and self._ndata is not None:
+            return self._ndata
+        return int(self.device['NData'].value)
+
+    # TODO: Add decorator ensure_comms
+    def StopAcquisition(self):
+        # NOTE: If we always send the AcqStop, we don't need to read the state
+        # self.ReadStateAndStatus()
+
+        # NOTE: this if is useless it will be always true
+        # if self.state == 'STATE_ACQUIRING' or self.state == 'STATE_RUNNING':
+        # NOTE: up to now I haven't seen any problem stopping acq like this
+        # even if it's already stopped.
+
+        self.StopPrefetch()
+        self.device['AcqStop'] = '1'
+        self.InvalidateState()
+
+    def StartAcquisition(self):
+        self.ReadStateAndStatus()
+        if self.state == State.Standby:
+            self.device['AcqStart'] = '1'
+            self.acquisition_index += 1
+            self.InvalidateState()
+            self.ResetBuffers()
+            if self.prefetch:
+                self.StartPrefetch()
+
+    def StartPrefetch(self):
+        """
+        Read the channels in background as soon as the acquisition ends.
+
+        So the readings overlap with the rest of the scan (e.g. the motion
+        of the motors) and ReadAll does not need to wait for them.
+        """
+        self.StopPrefetch()
+        # NOTE: every prefetch has its own abort event, so an aborted one
+        # never stores its values, even if it ends after the next start.
+        abort = threading.Event()
+        self._prefetch_abort = abort
+        self._prefetch_reading = False
+        self._prefetch_thread = threading.Thread(
+            target=self._Prefetch, args=(abort,),
+            name='AlbaemPrefetch-' + self.name)
+        self._prefetch_thread.daemon = True
+        self._prefetch_thread.start()
+
+    def StopPrefetch(self):
+        """
+        Abort the ongoing prefetch and discard the prefetched values.
+
+        It does not wait for the prefetch to end.
+        """
+        with self._prefetch_lock:
+            self._prefetch_abort.set()
+            self._prefetch_thread = None
+            self._prefetched = None
+
+    def _Prefetch(self, abort):
+        try:
+            while not abort.is_set():
+                self.ReadStateAndStatus()
+                if self.state is not State.Moving:
+                    with self._prefetch_lock:
+                        if abort.is_set():
+                            return
+                        self._prefetch_reading = True
+                    names = self._ReadAllAttributes()
+                    values = self.ReadAttributes(names)
+                    with self._prefetch_lock:
+                        if not abort.is_set():
+                            self._prefetched = names, values
+                    return
+                abort.wait(PREFETCH_PERIOD)
+        except Exception as exc:
+            # NOTE: ReadAll will read the values by itself.
+            self._log.warning('_Prefetch(): %s', exc)
+
+    def _TakePrefetched(self):
+        """
+        Return the prefetched attributes names and values (only once), None
+        if not available.
+
+        If the prefetch is reading the values, wait for them. If it is still
+        waiting for the end of the acquisition, abort it without waiting,
+        since ReadAll will read the values sooner.
+        """
+        thread = self._prefetch_thread
+        if thread is None or self.state is State.Moving:
+            return None
+        with self._prefetch_lock:
+            reading = self._prefetch_reading
+            if not reading:
+                self._prefetch_abort.set()
+        if reading:
+            thread.join(PREFETCH_TIMEOUT)
+        values = self._prefetched
+        self.StopPrefetch()
+        return values
+
+    def ReadAll(self):
+        """
+        Read the state and store the new samples of the 4 channels.
+
+        State, trigger mode and the buffers of the 4 channels are read in
+        only one round trip, unless they were already prefetched.
+
+        In continuous mode the samples are also stored while acquiring, so
+        the values of every trigger are given as soon as they arrive.
+        """
+        # NOTE: the buffers are read in only one attribute (Meas) if the
+        # device server has it, see _ExtractChannels().
+        # NOTE: the averages of the device (AverageCurrentCh) are not used,
+        # since it is not known if they are cleared by AcqStart as the
+        # buffers are. The mean is computed from the buffers instead.
+        prefetched = self._TakePrefetched()
+        if prefetched is None:
+            names = self._ReadAllAttributes()
+            prefetched = names, self.ReadAttributes(names)
+        names, values = prefetched
+        if 'AcqState' in values:
+            self.UpdateState(values['AcqState'],
+                             values.get('Status', self.status))
+        else:
+            # NOTE: it is read again alone, setting the Fault if it fails.
+            self.InvalidateState()
+            self.ReadStateAndStatus()
+        self._log.debug('State of %s when ReadAll: %s', self.name,
+                        self.state)
+
+        if self.state is not State.Moving:
+            self.SendSWTrigger()
+        if self.state is State.On and names is READ_STATE_ATTRIBUTES:
+            # NOTE: the point ended after the last read, see
+            # _ReadAllAttributes().
+            names = self._ReadAllAttributes()
+            values.update(self.ReadAttributes(
+                names[len(READ_STATE_ATTRIBUTES):]))
+
+        self.new_rows = 0
+        if self.state is State.On or self.repetitions > 1:
+            self._ExtractChannels(names, values)
+            ndata = int(values['NData']) if 'NData' in values else None
+            if ndata is not None:
+                self.UpdateDataTimeout(ndata)
+            for channel, attribute_name in enumerate(CHANNEL_ATTRIBUTES):
+                # NOTE: the samples of a channel not read are read in the
+                # next ReadAll.
+                if attribute_name not in values:
+                    continue
+                self.ReadNewSamples(channel, values[attribute_name], ndata)
+                self.values[channel] = reduce_samples(
+                    self.buffers[channel].view(), self.reduction)
+                self.point_statistics[channel] = \
+                    self._DescribeChannel(channel)
+
+    def _DescribeChannel(self, channel):
+        """
+        Return the statistics of the last point of a channel.
+
+        In step scans they are computed from the samples of the point. In
+        continuous mode a point is a row. If the samples are decimated, see
+        SetDecimation(), they are the ones of the block of the last row,
+        the only one of each point in step scans.
+        """
+        if self.repetitions == 1 and self.spreads is None:
+            return describe_samples(self.buffers[channel].view())
+        last = self.buffers[channel].last()
+        if last is None:
+            return NO_STATISTICS
+        if self.spreads is None:
+            return (0.0, last, last, 1)
+        std, minimum, maximum = [buff.last()
+                                 for buff in self.spreads[channel]]
+        return (std, minimum, maximum, self.decimation)
+
+    def _ReadAllAttributes(self):
+        """
+        Return the attributes to read by ReadAll.
+
+        While a point of a step scan is acquired only its state is read,
+        its buffers are not needed until it is over.
+        """
+        if self.repetitions == 1 and self.state is State.Moving:
+            return READ_STATE_ATTRIBUTES
+        if self._uses_meas and \
+                MEAS_ATTRIBUTE not in self._unreadable_attributes:
+            return READ_MEAS_ATTRIBUTES
+        return READ_ALL_ATTRIBUTES
+
+    def _ExtractChannels(self, names, values):
+        """
+        Add the buffers of the channels to the values read by ReadAll.
+
+        If the device server gives the buffers as strings, the next reads
+        take them from the Meas attribute, which has the same strings of
+        the 4 channels in only one attribute, parsed at once. Numeric
+        buffers are not converted at all, so they are kept.
+
+        If Meas can not be read (e.g. the device server does not have it)
+        the channels attributes are read instead, now and in the next
+        points.
+        """
+        if MEAS_ATTRIBUTE in values:
+            try:
+                buffers = decode_meas(values[MEAS_ATTRIBUTE])
+                values.update(zip(CHANNEL_ATTRIBUTES, buffers))
+            except (ValueError, TypeError) as exc:
+                self._log.warning('Meas of %s can not be decoded: %s',
+                                  self.name, exc)
+        elif isinstance(values.get(CHANNEL_ATTRIBUTES[0]), basestring):
+            self._uses_meas = True
+        if all(name in values for name in CHANNEL_ATTRIBUTES):
+            return
+        if MEAS_ATTRIBUTE in names:
+            self._log.warning('%s does not give the Meas attribute, the '
+                              'channels attributes will be read', self.name)
+            self._unreadable_attributes.add(MEAS_ATTRIBUTE)
+            self._uses_meas = False
+        values.update(self.ReadAttributes(CHANNEL_ATTRIBUTES))
+
 
 class AlbaemCoTiCtrl(CounterTimerController):
     """
@@ -51,12 +1831,169 @@ class AlbaemCoTiCtrl(CounterTimerController):
     acquisition buffer is calculated from acquisition time and SampleRate
     property.
 
-    Value returned by a channel is an average of buffer values.
+    Value returned by a channel is the last, the mean or the median of the
+    buffer values acquired in the point, see the Reduction property.
+
+    The std, min, max and nr of samples of each channel in the last point
+    are given by the Std, Min, Max and NrOfSamples attributes, computed
+    from the buffers already read by ReadAll.
+
+    Continuous (time scan) mode: when LoadOne() is called with more than
+    one repetition, the electrometers are configured once to acquire that
+    nr of triggers (BufferSize) and started only once. ReadOne() then gives
+    the values of the triggers acquired since its previous call. The
+    triggers are usually given by hardware, see the TriggerMode attribute.
+
+    Oversampling: with the SOFTWARE trigger mode every point of a step scan
+    can be acquired as several samples, and every trigger in continuous
+    mode as several shorter ones (see the Oversampling property). They are
+    decimated while they are read: ReadOne() and the Data attribute only
+    give the mean of each block, its std, min and max are given by the Std,
+    Min and Max attributes, and the rest of the samples are not kept. With
+    hardware triggers or gates the source gives only one pulse per trigger,
+    so it is not used.
+
+    Synchronization: the software trigger and gate of Sardana use the
+    SOFTWARE trigger mode of the electrometers, the hardware trigger the
+    HARDWARE mode and the hardware gate the GATE mode. The mode is written
+    in the next LoadOne(), only if it changed, and never read again, so in
+    hardware modes the points do not need any software trigger.
+
+    Several electrometers can be driven by the same controller giving their
+    names separated by commas in the Albaemname property. Axis 1 is the
+    timer and the next axes are the 4 channels of the first electrometer,
+    then the 4 channels of the second one, etc. All the electrometers are
+    started, stopped and read concurrently.
+
+    Streaming: with the StreamURI property the rows acquired are published
+    as soon as they are read, to local subscribers (see Subscribe()) or in
+    a ZeroMQ socket, so the live views do not need to poll the pool.
     """
 
-    MaxDevice = 5
-    ctrl_properties = {'Albaemname': {'Description': 'Albaem DS name',
+    MaxDevice = 1 + 4 * MAX_ELECTROMETERS
+    ctrl_properties = {'Albaemname': {'Description': 'Albaem DS name, or '
+                                                     'comma separated names '
+                                                     'of several Albaem DS',
                                       'Type': 'PyTango.DevString'},
+                       'BufferCapacity': {'Description': 'Nr of samples kept '
+                                                         'in memory for each '
+                                                         'channel',
+                                          'Type': 'PyTango.DevLong',
+                                          'DefaultValue': 100000},
+                       'StateCacheTime': {'Description': 'Time (in s) during '
+                                                         'which the last read '
+                                                         'state is reused',
+                                          'Type': 'PyTango.DevDouble',
+                                          'DefaultValue': 0.005},
+                       'ConfigCacheTime': {'Description': 'Time (in s) during '
+                                                          'which the last '
+                                                          'read configuration '
+                                                          '(ranges, filters, '
+                                                          'etc.) is reused',
+                                           'Type': 'PyTango.DevDouble',
+                                           'DefaultValue': 1.0},
+                       'ControlTimeout': {'Description': 'Timeout (in s) of '
+                                                         'the calls to the '
+                                                         'Albaem DS, '
+                                                         'increased for the '
+                                                         'buffers transfers '
+                                                         'by the nr of '
+                                                         'samples',
+                                          'Type': 'PyTango.DevDouble',
+                                          'DefaultValue': 1.0},
+                       'Reduction': {'Description': 'Value given by each '
+                                                    'channel in step scans: '
+                                                    'last, mean or median of '
+                                                    'the samples of the '
+                                                    'point',
+                                     'Type': 'PyTango.DevString',
+                                     'DefaultValue': 'last'},
+                       'Oversampling': {'Description': 'Nr of samples '
+                                                       'acquired and averaged '
+                                                       'for each point or '
+                                                       'trigger with software '
+                                                       'triggers, in '
+                                                       'continuous mode it '
+                                                       'must divide the '
+                                                       'integration time in '
+                                                       'ms',
+                                        'Type': 'PyTango.DevLong',
+                                        'DefaultValue': 1},
+                       'ValueRefPattern': {'Description': 'URI of the files '
+                                                          'written for the '
+                                                          'DataRef attribute, '
+                                                          'see ValueRefWriter',
+                                           'Type': 'PyTango.DevString',
+                                           'DefaultValue': ''},
+                       'StreamURI': {'Description': 'Where the rows '
+                                                    'acquired are published: '
+                                                    'local:// or a ZeroMQ '
+                                                    'endpoint, see '
+                                                    'StreamPublisher',
+                                     'Type': 'PyTango.DevString',
+                                     'DefaultValue': ''},
+                       'UseEvents': {'Description': 'Track the state with '
+                                                    'change events instead of '
+                                                    'polling it',
+                                     'Type': 'PyTango.DevBoolean',
+                                     'DefaultValue': False},
+                       'Prefetch': {'Description': 'Read the channels in '
+                                                   'background as soon as the '
+                                                   'acquisition ends',
+                                    'Type': 'PyTango.DevBoolean',
+                                    'DefaultValue': False},
+                       'Instrumentation': {'Description': 'Measure the calls '
+                                                          'to the controller '
+                                                          'and to the Albaem '
+                                                          'DS',
+                                           'Type': 'PyTango.DevBoolean',
+                                           'DefaultValue': False},
+                       'StatisticsLogPeriod': {'Description': 'Period (in s) '
+                                                              'to log the '
+                                                              'statistics, 0 '
+                                                              'to disable it',
+                                               'Type': 'PyTango.DevDouble',
+                                               'DefaultValue': 0.0},
+                       }
+
+    ctrl_attributes = {
+                       "Ranges": {
+                                Type: [str],
+                                Description: 'Range of every channel',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadWrite,
+                                MaxDimSize: (4 * MAX_ELECTROMETERS,),
+                                FGet: 'getRanges',
+                                FSet: 'setRanges'
+                                },
+                       "Filters": {
+                                Type: [str],
+                                Description: 'Filter of every channel',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadWrite,
+                                MaxDimSize: (4 * MAX_ELECTROMETERS,),
+                                FGet: 'getFilters',
+                                FSet: 'setFilters'
+                                },
+                       "Inversions": {
+                                Type: [str],
+                                Description: 'Digital inversion of every '
+                                             'channel',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadWrite,
+                                MaxDimSize: (4 * MAX_ELECTROMETERS,),
+                                FGet: 'getInversions',
+                                FSet: 'setInversions'
+                                },
+                       "Statistics": {
+                                Type: str,
+                                Description: 'Counters and latencies (in ms) '
+                                             'of the calls, if the '
+                                             'Instrumentation is enabled',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getStatistics'
+                                },
                        }
 
     # NOTE: Extra attributes definition. It's done in this way because my idea
@@ -140,7 +2077,8 @@ class AlbaemCoTiCtrl(CounterTimerController):
                         #         },
                         "TriggerMode": {
                                 Type: str,
-                                Description: 'Trigger mode: soft or gate',
+                                Description: 'Trigger mode: software, '
+                                             'hardware or gate',
                                 Memorize: NotMemorized,
                                 Access: DataAccess.ReadWrite,
                                 FGet: 'getTriggerMode',
@@ -153,6 +2091,57 @@ class AlbaemCoTiCtrl(CounterTimerController):
                                 Access: DataAccess.ReadOnly,
                                 MaxDimSize: (1000000,),
                                 FGet: 'getData'
+                                },
+                        "Timestamps": {
+                                Type: [float],
+                                Description: 'Estimated time of each '
+                                             'trigger of the last '
+                                             'acquisition given to the pool',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                MaxDimSize: (1000000,),
+                                FGet: 'getTimestamps'
+                                },
+                        "DataRef": {
+                                Type: str,
+                                Description: 'Reference (URI) to the data '
+                                             'of the last acquisition, see '
+                                             'the ValueRefPattern property',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getDataRef'
+                                },
+                        "Std": {
+                                Type: float,
+                                Description: 'Standard deviation of the '
+                                             'samples of the last point',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getStd'
+                                },
+                        "Min": {
+                                Type: float,
+                                Description: 'Min of the samples of the '
+                                             'last point',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getMin'
+                                },
+                        "Max": {
+                                Type: float,
+                                Description: 'Max of the samples of the '
+                                             'last point',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getMax'
+                                },
+                        "NrOfSamples": {
+                                Type: int,
+                                Description: 'Nr of samples of the last '
+                                             'point',
+                                Memorize: NotMemorized,
+                                Access: DataAccess.ReadOnly,
+                                FGet: 'getNrOfSamples'
                                 }
                              }
 
@@ -168,6 +2157,11 @@ class AlbaemCoTiCtrl(CounterTimerController):
 
         self._master = None
         self._integration_time = 0.0
+        # Nr of triggers loaded, more than 1 in continuous mode.
+        self._repetitions = 1
+        # Trigger mode loaded in the electrometers, None to keep theirs.
+        self._synchronization = AcqSynch.SoftwareTrigger
+        self._trigger_mode = None
 
         # NOTE: this variable is not used at all ...
         # self.avSamplesMax = 1000
@@ -175,9 +2169,10 @@ class AlbaemCoTiCtrl(CounterTimerController):
         # NOTE: Not sure that this is needed ...
         self._channels = []
 
-        # TODO: Refactor the initialization of self._measures
-        # self._measures = ['0', '0', '0', '0']
-        self._measures = []
+        # Electrometers driven by this controller, see _ForEachBox().
+        self._names = [name.strip() for name in self.Albaemname.split(',')]
+        self._boxes = []
+        self._pool = None
 
         # NOTE: the following attributes are not usefull at this moment ...
         self.lastvalues = []
@@ -187,43 +2182,155 @@ class AlbaemCoTiCtrl(CounterTimerController):
         self.sampleRate = 0.0
 
         self.state = None
+        self.status = ''
 
         # TODO: Refactor the following lists
-        self.ranges = ['', '', '', '']
-        self.filters = ['', '', '', '']
-        self.dinversions = ['', '', '', '']
-        self.offsets = ['', '', '', '']
+        nr_of_channels = 4 * len(self._names)
+        self.ranges = [''] * nr_of_channels
+        self.filters = [''] * nr_of_channels
+        self.dinversions = [''] * nr_of_channels
+        self.offsets = [''] * nr_of_channels
+
+        # Counters of the calls, None if the instrumentation is disabled.
+        self._statistics = None
+        self._statistics_log_time = time.time()
+        if self.Instrumentation:
+            self._statistics = Statistics()
+
+        # Writer of the buffers for DataRef, None if it is disabled.
+        self._value_ref_writer = None
+        if self.ValueRefPattern:
+            try:
+                self._value_ref_writer = ValueRefWriter(self.ValueRefPattern)
+            except ValueError as exc:
+                self._log.error('DataRef disabled: %s', exc)
+
+        self._oversampling = int(self.Oversampling)
+        if self._oversampling < 1:
+            self._log.error('Oversampling must be at least 1, it is '
+                            'disabled')
+            self._oversampling = 1
+        # Last reason logged for not using the oversampling, see
+        # _WarnOversampling().
+        self._oversampling_warning = None
+
+        # Publisher of the rows acquired, None if it is disabled.
+        self._publisher = None
+        if self.StreamURI:
+            try:
+                self._publisher = StreamPublisher(self.StreamURI, self._log)
+            # NOTE: also if the endpoint can not be bound, e.g. it is in use.
+            except Exception as exc:
+                self._log.error('Streaming disabled: %s', exc)
+
+        reduction = self.Reduction.lower()
+        if reduction not in REDUCTIONS:
+            self._log.error('Unknown Reduction %s, the last value is used',
+                            self.Reduction)
+            reduction = 'last'
 
         try:
-            # NOTE: ... thinking about a AlbaEMProxy class to handle the comms
-            self.AemDevice = PyTango.DeviceProxy(self.Albaemname)
-            self._ReadStateAndStatus()
+            self._boxes = [AlbaemProxy(name, self._log,
+                                       int(self.BufferCapacity),
+                                       self.StateCacheTime,
+                                       self.ConfigCacheTime,
+                                       self.ControlTimeout, self.UseEvents,
+                                       self.Prefetch, reduction,
+                                       self._statistics)
+                           for name in self._names]
+            self._UpdateState()
 
         # TODO: Handle Exceptions properly
         except Exception as e:
             error_msg = "Could not connect with: {0}.".format(self.Albaemname)
             exception_msg = "Exception: {}".format(e)
-            msg = '__init__(): {2}\n{1}'.format(error_msg, exception_msg)
+            msg = '__init__(): {0}\n{1}'.format(error_msg, exception_msg)
             self._log.error(msg)
             # WARNING: if you raise an exception here, the pool
             # will not start if the electrometer is switch off.
 
-    def _ReadStateAndStatus(self):
+    def __del__(self):
+        # NOTE: the endpoint is released for the next instance, e.g. when
+        # the controller is reloaded.
+        if getattr(self, '_publisher', None) is not None:
+            self._publisher.Close()
+        # NOTE: otherwise the threads of _ForEachBox() are left waiting for
+        # tasks until the pool process ends.
+        if getattr(self, '_pool', None) is not None:
+            self._pool.terminate()
+
+    def _Measure(self, method):
+        """
+        Return a context manager measuring a call of a controller method.
+
+        If the instrumentation is disabled it does nothing.
+        """
+        if self._statistics is None:
+            return NO_MEASUREMENT
+        self._LogStatistics()
+        return self._statistics.Measure(method)
+
+    def _LogStatistics(self):
+        period = self.StatisticsLogPeriod
+        if period <= 0 or time.time() - self._statistics_log_time < period:
+            return
+        self._statistics_log_time = time.time()
+        self._log.info('Statistics:\n%s', self._statistics.Summary())
+
+    def _ForEachBox(self, func):
+        """
+        Call func(box) for all the electrometers and return the results.
+
+        With more than one electrometer the calls are done concurrently.
+        """
+        if len(self._boxes) == 1:
+            return [func(self._boxes[0])]
+        if self._pool is None:
+            self._pool = ThreadPool(len(self._boxes))
+        return self._pool.map(func, self._boxes)
+
+    def _GetBox(self, axis):
+        """Return the electrometer of an axis, the first one for the timer."""
+        return self._boxes[max(axis - 2, 0) // 4]
+
+    def _GetChannel(self, axis):
+        """Return the channel index (starting at 0) of an axis."""
+        return (axis - 2) % 4
+
+    def _ReadState(self, box):
+        """
+        Read the state of one electrometer.
+
+        If it is not reachable its state is Fault, without stopping the
+        reading of the other ones.
+        """
         try:
-            state = (self.AemDevice['AcqState'].value).strip()
-            self.state = ALBAEM_STATE_MAP[state]
-            self.status = self.AemDevice.status()
-            print '    Read State finished with state: {}'.format(self.state)
-        # TODO: Improve the try/except please!
-        except Exception as exc:
-            self._log.error(exc)
-            raise
+            box.ReadStateAndStatus()
+        except Exception:
+            # NOTE: already logged by the box.
+            pass
+
+    def _UpdateState(self):
+        """Combine the states of all the electrometers."""
+        states = [box.state for box in self._boxes]
+        for state in (None, State.Fault, State.Moving, State.Standby,
+                      State.On):
+            if state in states:
+                self.state = state
+                break
+        if len(self._boxes) == 1:
+            self.status = self._boxes[0].status
+        else:
+            self.status = '\n'.join('{0}: {1}'.format(box.name, box.status)
+                                    for box in self._boxes)
 
     def AddDevice(self, axis):
         """Add device to controller."""
         self._log.debug("AddDevice(%d): Entering...", axis)
+        if axis > 1 + 4 * len(self._names):
+            raise Exception('Axis {0} not available with {1} '
+                            'electrometer(s)'.format(axis, len(self._names)))
         self._channels.append(axis)
-        print 'Channel added: {}'.format(axis)
         # NOTE: As far as I know, this is not needed now.
         # self.AemDevice.enableChannel(axis)
 
@@ -234,10 +2341,11 @@ class AlbaemCoTiCtrl(CounterTimerController):
 
     def StateOne(self, axis):
         """Read state of one axis."""
-        msg = 'StateOne({}): Entering ...'.format(axis)
         self._log.debug("StateOne(%d): Entering...", axis)
-        print msg
-        return (self.state, self.status)
+        if axis == 1:
+            return (self.state, self.status)
+        box = self._GetBox(axis)
+        return (box.state, box.status)
 
     def StateAll(self):
         """Read state of all axis."""
@@ -245,12 +2353,14 @@ class AlbaemCoTiCtrl(CounterTimerController):
         # TODO: Add proper try/except (KeyError, AemDevice not responding)
         # _state = str(self.AemDevice.state())
         try:
-            self._ReadStateAndStatus()
-            print 'StateAll: {}'.format(self.state)
+            with self._Measure('StateAll'):
+                self._ForEachBox(self._ReadState)
+            self._UpdateState()
+            self._log.debug('StateAll(): %s', self.state)
             # TODO: Should be return status here? ...
             return self.state
         except Exception as exc:
-            print 'EXCEPTIONNNN in StateAll!!!!: {}'.format(exc)
+            self._log.error('StateAll(): %s', exc)
 
 #    def PreReadOne(self, axis):
 #        self._log.debug("PreReadOne(%d): Entering...", axis)
@@ -258,18 +2368,17 @@ class AlbaemCoTiCtrl(CounterTimerController):
 
     def ReadOne(self, axis):
         """Read the value of one axis."""
-        msg = "ReadOne({}): Entering...".format(axis)
-        self._log.debug(msg)
-        print msg
+        self._log.debug("ReadOne(%d): Entering...", axis)
+        if self._repetitions > 1:
+            return self._ReadNewValues(axis)
         if axis == 1:
-            print '  Integration time = {}'.format(self._integration_time)
             return self._integration_time
 
-        if self._measures is not []:
-            # TODO: Ensure that this is a valid value.
-            meas = self._measures[axis-2]
-            print '  Value for axis {0}: {1}'.format(axis, meas)
-            return meas
+        # NOTE: None is returned if nothing was acquired yet.
+        box = self._GetBox(axis)
+        meas = box.values[self._GetChannel(axis)]
+        self._log.debug('Value for axis %d: %s', axis, meas)
+        return meas
 
         # NOTE: old code used for tests, to be removed.
         # attr = 'AverageCurrentCh{}'.format(axis-1)
@@ -283,93 +2392,85 @@ class AlbaemCoTiCtrl(CounterTimerController):
         # # self.AemDevice['AcqStop'] = '1'
         # return average_current
 
-        # TODO: Pending to handle properly when self._measures is []
+        # TODO: Pending to handle properly when nothing was acquired yet.
         # else:
         #     # NOTE: maybe ReadOne is called before measures is filled up.
         #     raise Exception('Last measured values not available.')
 
+    def _ReadNewValues(self, axis):
+        """
+        Return the values of the triggers aligned by the last ReadAll.
+
+        For the timer, the integration time of each one of the triggers.
+        """
+        box = self._GetBox(axis)
+        if axis == 1:
+            return [self._integration_time] * box.new_rows
+        channel = self._GetChannel(axis)
+        values = box.GetNewRows(channel)
+        self._log.debug('New values for axis %d: %s', axis,
+                        Abbreviated(values))
+        return values.tolist()
+
+    def _AlignRows(self):
+        """
+        Give to the pool only the triggers acquired by all the channels.
+
+        The channels are read independently, so one of them can be behind
+        the others: the rest of channels keep their samples until it
+        catches up. When a continuous acquisition is over, the samples
+        still missing are flagged as NaN (see AlbaemProxy.PadRows()).
+        """
+        over = all(box.state is State.On for box in self._boxes)
+        if self._repetitions > 1 and over:
+            rows = max(box.GetAcquiredRows() for box in self._boxes)
+            for box in self._boxes:
+                box.PadRows(rows)
+        rows = min(box.GetCompleteRows() for box in self._boxes)
+        for box in self._boxes:
+            box.EmitRows(rows)
+
+    def _PublishRows(self):
+        """Publish the rows given by the last ReadAll, see StreamPublisher."""
+        for box in self._boxes:
+            if not box.new_rows:
+                continue
+            self._publisher.Publish(box.name, box.acquisition_index,
+                                    box.GetFirstNewRow(),
+                                    box.timestamps.view(box.new_rows),
+                                    [box.GetNewRows(channel)
+                                     for channel in range(4)])
+
+    def Subscribe(self, callback):
+        """
+        Receive the rows acquired as soon as they are read, see
+        StreamPublisher.Subscribe(). It needs the StreamURI property.
+        """
+        if self._publisher is None:
+            raise RuntimeError('Streaming is disabled, set StreamURI')
+        self._publisher.Subscribe(callback)
+
+    def Unsubscribe(self, callback):
+        if self._publisher is not None:
+            self._publisher.Unsubscribe(callback)
+
     def PreReadAll(self):
         self.readchannels = []
         self._log.debug("PreReadAll(): Entering...")
-        print 'PreReadAll(): Entering ... '
 
     def ReadAll(self):
         """Read all the axis."""
-        print 'ReadAll(): Entering ...'
         self._log.debug("ReadAll(): Entering...")
         # if self.state == PyTango.DevState.ON:
 
-        self._ReadStateAndStatus()
-        print '    State when ReadAll: {}'.format(self.state)
-        print self.state
-
-        if self.state is not State.Moving:
-            self._SendSWTrigger()
-
-        if self.state is State.On:
-
-            self._measures = []
-            # TODO: This should be read in only one command, but extracting
-            # values from the MEAS attribute is not properly done yet.
-            # NOTE: It's not ok to use the average current if the buffer hasn't
-            # been cleaned after the previous scan. Is it cleared as the MEAS
-            # attribute?
-            for i in range(1, 5):
-                # attribute_name = 'AverageCurrentCh{}'.format(i)
-                attribute_name = 'CurrentCh{}'.format(i)
-                values = self.AemDevice[attribute_name].value
-                last_value = self._ExtractLastValue(values)
-                self._measures.append(last_value)
-
-            # # TODO: Treat this response, because the expected values are not in
-            # # the same format:
-            # # [['CHAN01','[]'],['CHAN02','[]'],['CHAN03', '[]'],['CHAN04','[]']]
-            # _measures = self.AemDevice['Meas'].value
-            # print '  Measurements: {}: '.format(_measures)
-            # # TODO: maybe this shouldn't be done in the controller and it
-            # # should be in the DS
-            # # NOTE: Should we return the AverageCurrent instead?
-            # self._measures = self._ExtractAllValues(_measures)
-            # print '    Measurements after extraction: {}'.format(self._measures)
-
-    def _SendSWTrigger(self):
-        trigger_mode = self.AemDevice['TriggerMode'].value
-        if trigger_mode.lower().strip() == 'software':
-            print '    Sending SWTrigger!'
-            self.AemDevice['SWTrigger'] = '1'
-
-    def _ExtractLastValue(self, values):
-        print 'Ready to extract values from: {}'.format(values)
-        last_value = None
-        try:
-            last_value = float(values.strip('[]\r').split(',')[-1])
-            print '    Last value = {}'.format(last_value)
-            return last_value
-        except Exception as e:
-            print 'Error extracting last value'
-
-    def _ExtractAllValues(self, measurements):
-        """
-        Extract the last value acquired.
-
-        We know the channel by the position in the array. This could be
-        improved and use a proper data structure.
-        """
-        print '    Extracting values for: {}'.format(measurements)
-        # [['CHAN01','[1, 2, ...]'], ...]
-        # list_of_values = [meas[1] for meas in measurements]
-        # ['[]','[]', ...]
-        # m = [meas[1].strip("[]").split(',')[-1] for meas in measurements]
-
-        values = []
-        for meas in measurements:
-            print "    Meas: {}".format(meas)
-            if meas[1] is not '[]':
-                values.append(meas[1].strip("[]").split(',')[-1])
-            else:
-                print '    Values were empty!!!!'
-        print '    Extracted values: {}'.format(m)
-        return m
+        # NOTE: the readings of all the electrometers are stored before
+        # returning, so ReadOne gives the values of the same point.
+        with self._Measure('ReadAll'):
+            self._ForEachBox(AlbaemProxy.ReadAll)
+            self._AlignRows()
+        self._UpdateState()
+        if self._publisher is not None:
+            self._PublishRows()
 
     def AbortOne(self, axis):
         """Stop the acquisition for one axis."""
@@ -383,22 +2484,12 @@ class AlbaemCoTiCtrl(CounterTimerController):
         self._log.debug("AbortAll(): Entering...")
         self._StopAcquisition()
 
-    # TODO: Add decorator ensure_comms
     def _StopAcquisition(self):
-        # NOTE: If we always send the AcqStop, we don't need to read the state
-        # self._ReadStateAndStatus()
-
-        # NOTE: this if is useless it will be always true
-        # if self.state == 'STATE_ACQUIRING' or self.state == 'STATE_RUNNING':
-        # NOTE: up to now I haven't seen any problem stopping acq like this
-        # even if it's already stopped.
-
-        self.AemDevice['AcqStop'] = '1'
+        self._ForEachBox(AlbaemProxy.StopAcquisition)
 
     def PreStartAllCT(self):
         """Configure acquisition before start it."""
         self._log.debug("PreStartAllCT(): Entering...")
-        print 'PreStartAllCT(): Entering ...'
         self.acqchannels = []
 
         try:
@@ -419,9 +2510,7 @@ class AlbaemCoTiCtrl(CounterTimerController):
         Record axis to be started so later on we can distinguish if we are
         starting only the master channel.
         """
-        msg = "PreStartOneCT({}): Entering...".format(axis)
         self._log.debug("PreStartOneCT(%d): Entering...", axis)
-        print msg
         # NOTE: Not sure if this is worthy.
         self.acqchannels.append(axis)
         return True
@@ -438,11 +2527,10 @@ class AlbaemCoTiCtrl(CounterTimerController):
         master channel.
         """
         self._log.debug("StartAllCT(): Entering...")
-        print 'StartAllCT(): Entering ...'
         try:
-            self._ReadStateAndStatus()
-            if self.state == State.Standby:
-                self.AemDevice['AcqStart'] = '1'
+            with self._Measure('StartAllCT'):
+                self._ForEachBox(AlbaemProxy.StartAcquisition)
+            self._UpdateState()
 
         except Exception as e:
             # TODO: Again ... a decorator here will make the code cleaner.
@@ -454,13 +2542,53 @@ class AlbaemCoTiCtrl(CounterTimerController):
             # TODO: improve exception handling.
             raise
 
+    def _GetDecimation(self, value, repetitions, trigger_mode):
+        """
+        Return the nr of samples acquired for each point of a step scan or
+        trigger in continuous mode, see the Oversampling property.
+
+        The hardware trigger and gate sources give only one pulse per
+        trigger, so the oversampling is only used with software triggers.
+        In step scans the samples are acquired during the integration time
+        of the point, like the BufferSize samples of the device. In
+        continuous mode every trigger is acquired as several shorter ones,
+        so it is not used if it does not divide the integration time (in
+        ms, the resolution of AcqTime): the samples always integrate the
+        whole time.
+        """
+        oversampling = self._oversampling
+        if oversampling == 1:
+            return 1
+        if trigger_mode != TRIGGER_MODES['software']:
+            self._WarnOversampling('Oversampling is not used in %s trigger '
+                                   'mode', trigger_mode)
+            return 1
+        if repetitions == 1:
+            self._oversampling_warning = None
+            return oversampling
+        integration_time = value * 1000
+        milliseconds = int(round(integration_time))
+        if abs(integration_time - milliseconds) > 1e-6 or \
+                milliseconds % oversampling:
+            self._WarnOversampling('Oversampling is not used: %d does not '
+                                   'divide the integration time, %f ms',
+                                   oversampling, integration_time)
+            return 1
+        self._oversampling_warning = None
+        return oversampling
+
+    def _WarnOversampling(self, msg, *args):
+        # NOTE: it is checked in every point of the step scans, so the same
+        # reason is only logged once.
+        if (msg,) + args != self._oversampling_warning:
+            self._oversampling_warning = (msg,) + args
+            self._log.warning(msg, *args)
+
     def PreLoadOne(self, axis, value):
         """
         Configuration needed before loading an axis.
         """
-        msg = "PreLoadOne({0}, {1}): Entering...".format(axis, value)
         self._log.debug("PreLoadOne(%d, %f): Entering...", axis, value)
-        print msg
         # TODO: This shouldn't be under an if axis == 1 ???
         if axis == 1:
             self._master = None
@@ -468,30 +2596,62 @@ class AlbaemCoTiCtrl(CounterTimerController):
         # TODO: Do we need to return True? It's quite ugly.
         return True
 
-    def LoadOne(self, axis, value):
+    def LoadOne(self, axis, value, repetitions=1):
         """
         Load one axis in controller.
 
         Here we are keeping a reference to the master channel, so later on,
         in StartAll(), we can distinguish if we are starting only the master
         channel.
+
+        With more than one repetition the acquisition is continuous: the
+        electrometers acquire `repetitions` triggers of `value` seconds
+        after being started only once.
         """
-        msg = "LoadOne({0}, {1}): Entering...".format(axis, value)
-        self._log.debug("LoadOne(%d, %f): Entering...", axis, value)
+        self._log.debug("LoadOne(%d, %f, %d): Entering...", axis, value,
+                        repetitions)
         # TODO: This ... shouldn't be an if axis == 1 ?
         self._master = axis
 
         if self._integration_time != value:
             self._integration_time = value
+        self._repetitions = repetitions
+        trigger_mode = self._trigger_mode
         try:
             # TODO: Do we want this? Let's configure it by hand at the begining
             if axis == 1:
-                self.AemDevice['AcqStop'] = '1'
-                # TODO: Solve this bug: acqtime must be sent twice ... weird
-                # UPDATE: it's even worst ... it's not working ...
-                val = str(int(value * 1000))
-                for i in range(2):
-                    self.AemDevice['AcqTime'] = val
+                def configure(box):
+                    decimation = self._GetDecimation(
+                        value, repetitions, trigger_mode or
+                        box.GetTriggerMode())
+                    box.repetitions = repetitions
+                    box.ReserveRows(repetitions)
+                    box.SetDecimation(decimation)
+                    box.UpdateDataTimeout()
+                    if decimation == 1 or repetitions == 1:
+                        val = str(int(value * 1000))
+                    else:
+                        val = str(int(round(value * 1000)) // decimation)
+                    config = []
+                    buffer_size = box.GetBufferSize(repetitions * decimation)
+                    if buffer_size is not None:
+                        config.append(('BufferSize', buffer_size))
+                    if trigger_mode is not None:
+                        config.append(('TriggerMode', trigger_mode))
+                    # NOTE: nothing to do if the configuration has not changed.
+                    if (box.GetConfig('AcqTime') == val and
+                            all(box.GetConfig(name) == config_value
+                                for name, config_value in config)):
+                        return
+                    box.StopAcquisition()
+                    if box.GetConfig('AcqTime') != val:
+                        # TODO: Solve this bug: acqtime must be sent twice ...
+                        # UPDATE: it's even worst ... it's not working ...
+                        box['AcqTime'] = val
+                        box.WriteConfig('AcqTime', val)
+                    box.WriteConfigs(config)
+                with self._Measure('LoadOne'):
+                    self._ForEachBox(configure)
             #
             #     # TODO: This part is still not fully tested###########
             #     # self.sampleRate = self.AemDevice['SampleRate'].value
@@ -532,22 +2692,88 @@ class AlbaemCoTiCtrl(CounterTimerController):
             # TODO: Improve error handlig
             raise
 
+    def ConfigureChannels(self, ranges=None, filters=None, inversions=None):
+        """
+        Configure the channels of all the electrometers at once.
+
+        Every argument is a list with the value of each channel, in axis
+        order (the first one is axis 2). None or empty values leave the
+        channel unchanged. Each electrometer is configured in only one
+        round trip, and the local ranges, filters and dinversions are only
+        updated if all the electrometers were configured.
+        """
+        nr_of_channels = 4 * len(self._boxes)
+        name_values = dict((box.name, []) for box in self._boxes)
+        caches = []
+        for prefix, values, cache in (('CARangeCh', ranges, self.ranges),
+                                      ('CAFilterCh', filters, self.filters),
+                                      ('CAInversionCh', inversions,
+                                       self.dinversions)):
+            values = values or []
+            if len(values) > nr_of_channels:
+                raise Exception('{0} values given for {1} channels'.format(
+                    len(values), nr_of_channels))
+            cache = list(cache)
+            for index, value in enumerate(values):
+                if not value:
+                    continue
+                box = self._boxes[index // 4]
+                attr = '{0}{1}'.format(prefix, index % 4 + 1)
+                name_values[box.name].append((attr, value))
+                cache[index] = value
+            caches.append(cache)
+
+        def configure(box):
+            box.WriteConfigs(name_values[box.name])
+        with self._Measure('ConfigureChannels'):
+            self._ForEachBox(configure)
+        self.ranges, self.filters, self.dinversions = caches
+
+    def _GetChannelsConfig(self, prefix):
+        return [box.GetConfig('{0}{1}'.format(prefix, i))
+                for box in self._boxes for i in range(1, 5)]
+
+    def getRanges(self):
+        return self._GetChannelsConfig('CARangeCh')
+
+    def setRanges(self, value):
+        self.ConfigureChannels(ranges=value)
+
+    def getFilters(self):
+        return self._GetChannelsConfig('CAFilterCh')
+
+    def setFilters(self, value):
+        self.ConfigureChannels(filters=value)
+
+    def getInversions(self):
+        return self._GetChannelsConfig('CAInversionCh')
+
+    def setInversions(self, value):
+        self.ConfigureChannels(inversions=value)
+
+    def getStatistics(self):
+        if self._statistics is None:
+            return 'Instrumentation disabled'
+        return self._statistics.Summary()
+
+    # NOTE: the getters are served from the configuration cached by each
+    # electrometer, see AlbaemProxy.GetConfig(), since the GUIs poll them.
     def getRange(self, axis):
-        attr = 'CARangeCh{}'.format(axis)
+        attr = 'CARangeCh{}'.format(self._GetChannel(axis) + 1)
         # NOTE: axis - 2 because it start in 1 and the 1st is the timer.
         # NOTE: Do we need the 1st to act as timer?
         # self.ranges[axis-2] = self.AemDevice['Ranges'].value[axis-2]
-        self.ranges[axis-2] = self.AemDevice[attr].value
+        self.ranges[axis-2] = self._GetBox(axis).GetConfig(attr)
         return self.ranges[axis-2]
 
     def getFilter(self, axis):
-        attr = 'CAFilterCh{}'.format(axis)
-        self.filters[axis-2] = self.AemDevice[attr].value
+        attr = 'CAFilterCh{}'.format(self._GetChannel(axis) + 1)
+        self.filters[axis-2] = self._GetBox(axis).GetConfig(attr)
         return self.filters[axis-2]
 
     def getInversion(self, axis):
-        attr = 'CAInversionCh{}'.format(axis)
-        self.dinversions[axis-2] = self.AemDevice[attr].value
+        attr = 'CAInversionCh{}'.format(self._GetChannel(axis) + 1)
+        self.dinversions[axis-2] = self._GetBox(axis).GetConfig(attr)
         return self.dinversions[axis-2]
 
     # TODO: update this method when attribute available in DS
@@ -573,15 +2799,12 @@ class AlbaemCoTiCtrl(CounterTimerController):
     #     return freq
 
     def getTriggerMode(self, axis):
-        # TODO: Refactor this!
-        mode = self.AemDevice["TriggerMode"].value
-        # if mode == "INT":
-        #     return "soft"
-        # if mode == "EXT":
-        #     return "gate"
+        mode = self._GetBox(axis).GetTriggerMode()
+        if mode is not None:
+            return mode.lower()
 
     def getNrOfTriggers(self, axis):
-        nrOfTriggers = int(self.AemDevice["NData"].value)
+        nrOfTriggers = self._GetBox(axis).GetNrOfTriggers()
         return nrOfTriggers
 
     # def getAcquisitionTime(self, axis):
@@ -589,24 +2812,70 @@ class AlbaemCoTiCtrl(CounterTimerController):
     #     return acqTime
 
     def getData(self, axis):
-        attr = 'CurrentCh{}'.format(axis-1)
-        data = self.AemDevice[attr].value
-        return data
+        """
+        Return the samples of the channel acquired since the last read of
+        the attribute.
+
+        The samples are returned as a view of the channel buffer, not copied.
+
+        The buffer is downloaded only if new triggers arrived, so the Data
+        attribute can be read in chunks during the whole acquisition,
+        without taking the values given to the pool, see
+        AlbaemProxy.ReadData().
+        """
+        box = self._GetBox(axis)
+        return box.ReadData(self._GetChannel(axis))
+
+    def getTimestamps(self, axis):
+        return self._GetBox(axis).timestamps.view()
+
+    def _GetStatistics(self, axis):
+        return self._GetBox(axis).point_statistics[self._GetChannel(axis)]
+
+    def getStd(self, axis):
+        return self._GetStatistics(axis)[0]
+
+    def getMin(self, axis):
+        return self._GetStatistics(axis)[1]
+
+    def getMax(self, axis):
+        return self._GetStatistics(axis)[2]
+
+    def getNrOfSamples(self, axis):
+        return self._GetStatistics(axis)[3]
+
+    def getDataRef(self, axis):
+        """
+        Return the reference to the data of the channel in the last
+        acquisition, so the consumers read it from the file instead of
+        receiving it through the pool.
+
+        It is empty if ValueRefPattern is not set or the acquisition is not
+        over, and fails if the buffers did not keep all the samples, see
+        AlbaemProxy.GetValueRefs().
+        """
+        if self._value_ref_writer is None:
+            return ''
+        box = self._GetBox(axis)
+        refs = box.GetValueRefs(self._value_ref_writer)
+        if refs is None:
+            return ''
+        return refs[self._GetChannel(axis)]
 
     def setRange(self, axis, value):
         self.ranges[axis-2] = value
-        attr = 'CARangeCh{}' + str(axis-1)
-        self.AemDevice[attr] = str(value)
+        attr = 'CARangeCh{}'.format(self._GetChannel(axis) + 1)
+        self._GetBox(axis).WriteConfig(attr, value)
 
     def setFilter(self, axis, value):
         self.filters[axis-2] = value
-        attr = 'CAFilterCh{}' + str(axis-1)
-        self.AemDevice[attr] = str(value)
+        attr = 'CAFilterCh{}'.format(self._GetChannel(axis) + 1)
+        self._GetBox(axis).WriteConfig(attr, value)
 
     def setInversion(self, axis, value):
         self.dinversions[axis-2] = value
-        attr = 'CAInversionCh{}' + str(axis-1)
-        self.AemDevice[attr] = str(value)
+        attr = 'CAInversionCh{}'.format(self._GetChannel(axis) + 1)
+        self._GetBox(axis).WriteConfig(attr, value)
 
     # TODO: update this method when attribute available in DS
     # def setOffset(self, axis, value):
@@ -631,12 +2900,16 @@ class AlbaemCoTiCtrl(CounterTimerController):
     #     self.AemDevice["samplerate"] = rate
 
     def setTriggerMode(self, axis, value):
-        # TODO: Ensure this works like this
-        if value.lower() == "software":
-            mode = "SOFTWARE"
-        if value.lower() == "hardware":
-            mode = "HARDWARE"
-        self.AemDevice["TriggerMode"] = mode
+        try:
+            mode = TRIGGER_MODES[value.lower().strip()]
+        except KeyError:
+            raise ValueError('Unknown trigger mode {0}, it must be one of: '
+                             '{1}'.format(value, ', '.join(TRIGGER_MODES)))
+        self._trigger_mode = mode
+
+        def set_mode(box):
+            box.WriteConfig("TriggerMode", mode)
+        self._ForEachBox(set_mode)
 
     # NOTE: Now it's read only.
     # def setNrOfTriggers(self, axis, value):
@@ -646,22 +2919,30 @@ class AlbaemCoTiCtrl(CounterTimerController):
     #     self.AemDevice["TriggerDelay"] = value
     #     self.AemDevice["AvSamples"] = value
 
-    # NOTE: Not sure if it's needed.
-    # def SetCtrlPar(self, par, value):
-    #     """Set controller parameters."""
-    #     debug_msg = 'SetCtrlPar({0}, {1}) entering...'.format(par, value)
-    #     self._log.debug(debug_msg)
-    #     if par == 'trigger_type':
-    #         if value == AcqTriggerType["Software"]:
-    #             self.AemDevice['TriggerMode'] = 'INT'
-    #         elif value == AcqTriggerType["Gate"]:
-    #             self.AemDevice['TriggerMode'] = 'EXT'
-    #         else:
-    #             exception_msg = 'Alba electrometer allows only Software or ' \
-    #                             'Gate triggering'
-    #             raise Exception(exception_msg)
-    #     else:
-    #         super(AlbaemCoTiCtrl, self).SetCtrlPar(par, value)
+    def SetCtrlPar(self, par, value):
+        """
+        Set controller parameters.
+
+        The synchronization selects the trigger mode loaded in the next
+        LoadOne(), see SYNCHRONIZATION_MODES.
+        """
+        self._log.debug('SetCtrlPar(%s, %s): Entering...', par, value)
+        if par == 'synchronization':
+            try:
+                self._trigger_mode = SYNCHRONIZATION_MODES[value]
+            except KeyError:
+                raise ValueError('Alba electrometer allows only software '
+                                 'trigger or gate, hardware trigger or '
+                                 'hardware gate synchronization')
+            self._synchronization = value
+        else:
+            super(AlbaemCoTiCtrl, self).SetCtrlPar(par, value)
+
+    def GetCtrlPar(self, par):
+        """Get controller parameters."""
+        if par == 'synchronization':
+            return self._synchronization
+        return super(AlbaemCoTiCtrl, self).GetCtrlPar(par)
 
     # NOTE: Not sure if this is needed
     # def SendToCtrl(self, cmd):
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+
+"""Simulated AlbaEM# device server used to benchmark the controller."""
+
+import threading
+import time
+from collections import defaultdict
+
+import numpy
+import PyTango
+
+__author__ = 'amilan'
+__docformat__ = 'restructuredtext'
+__all__ = ['FakeAttribute', 'FakeAlbaemDevice']
+
+
+class FakeAttribute(object):
+    """Minimal replacement of PyTango.DeviceAttribute."""
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.has_failed = False
+
+
+class FakeAlbaemDevice(object):
+    """
+    Replacement of the PyTango.DeviceProxy of an AlbaEM# device server.
+
+    Every call to the device counts as one round trip and lasts at least
+    `latency` seconds. An acquisition lasts AcqTime milliseconds and then
+    adds BufferSize samples to each one of the 4 channels.
+
+    In HARDWARE trigger mode an acquisition lasts BufferSize triggers, one
+    every AcqTime milliseconds, and every trigger adds one sample to each
+    one of the 4 channels.
+
+    :param name: name of the simulated device.
+    :param latency: time (in s) spent in every round trip.
+    :param buffer_size: initial BufferSize, nr of samples acquired per
+                        channel and start.
+    :param as_string: give the buffers as strings, like old device servers,
+                      instead of numeric arrays.
+    """
+
+    def __init__(self, name, latency=0.0, buffer_size=1, as_string=False):
+        self.name = name
+        self.latency = latency
+        self.as_string = as_string
+        # Timeout (in s) of the proxy, only recorded.
+        self.timeout = 3.0
+
+        # Round trips done, by kind of access and attribute name.
+        self.round_trips = defaultdict(int)
+
+        self._lock = threading.Lock()
+        self._start_time = None
+        self._acquired = False
+        self._buffers = [numpy.empty(0) for _ in range(4)]
+        self._attributes = {
+            'AcqTime': '1000',
+            'TriggerMode': 'SOFTWARE',
+            'BufferSize': str(buffer_size),
+        }
+        for i in range(1, 5):
+            self._attributes['CARangeCh{}'.format(i)] = '1mA'
+            self._attributes['CAFilterCh{}'.format(i)] = 'NO'
+            self._attributes['CAInversionCh{}'.format(i)] = 'NO'
+
+    @property
+    def total_round_trips(self):
+        return sum(self.round_trips.values())
+
+    def _RoundTrip(self, kind, name=''):
+        self.round_trips['{0} {1}'.format(kind, name).strip()] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _Update(self):
+        """Add the samples acquired and finish the acquisition if over."""
+        if self._start_time is None:
+            return
+        acq_time = float(self._attributes['AcqTime']) / 1000
+        elapsed = time.time() - self._start_time
+        if self._attributes['TriggerMode'] == 'HARDWARE':
+            triggers = int(self._attributes['BufferSize'])
+            nr_of_samples = min(int(elapsed / acq_time), triggers)
+            self._Acquire(nr_of_samples - len(self._buffers[0]))
+            if nr_of_samples < triggers:
+                return
+        elif elapsed < acq_time:
+            return
+        else:
+            self._Acquire(int(self._attributes['BufferSize']))
+        self._start_time = None
+        self._acquired = True
+
+    def _Acquire(self, nr_of_samples):
+        for i in range(4):
+            samples = numpy.random.normal(i + 1, 0.01, nr_of_samples)
+            self._buffers[i] = numpy.concatenate((self._buffers[i], samples))
+
+    def _Read(self, name):
+        with self._lock:
+            self._Update()
+            if name == 'AcqState':
+                if self._start_time is not None:
+                    return 'STATE_ACQUIRING'
+                return 'STATE_RUNNING' if self._acquired else 'STATE_ON'
+            if name in ('Status', 'State'):
+                return 'The device is simulated'
+            if name == 'NData':
+                return len(self._buffers[0])
+            if name == 'Meas':
+                return [['CHAN{:02d}'.format(i + 1),
+                         '[{}]'.format(', '.join(map(repr, buff)))]
+                        for i, buff in enumerate(self._buffers)]
+            if name.startswith('AverageCurrentCh'):
+                buff = self._buffers[int(name[-1]) - 1]
+                return buff.mean() if len(buff) else 0.0
+            if name.startswith('CurrentCh'):
+                buff = self._buffers[int(name[-1]) - 1]
+                if self.as_string:
+                    return '[{}]\r'.format(', '.join(map(repr, buff)))
+                return buff.copy()
+            try:
+                return self._attributes[name]
+            except KeyError:
+                PyTango.Except.throw_exception('API_AttrNotFound',
+                                               '{} not found'.format(name),
+                                               'FakeAlbaemDevice._Read')
+
+    def _Write(self, name, value):
+        with self._lock:
+            self._Update()
+            if name == 'AcqStart':
+                self._buffers = [numpy.empty(0) for _ in range(4)]
+                self._acquired = False
+                self._start_time = time.time()
+            elif name == 'AcqStop':
+                self._start_time = None
+                self._acquired = False
+            elif name != 'SWTrigger':
+                self._attributes[name] = value
+
+    def __getitem__(self, name):
+        self._RoundTrip('read', name)
+        return FakeAttribute(name, self._Read(name))
+
+    def __setitem__(self, name, value):
+        self._RoundTrip('write', name)
+        self._Write(name, value)
+
+    def read_attribute(self, name):
+        return self[name]
+
+    def write_attribute(self, name, value):
+        self[name] = value
+
+    def read_attributes(self, names):
+        self._RoundTrip('read_attributes')
+        return [FakeAttribute(name, self._Read(name)) for name in names]
+
+    def write_attributes(self, name_values):
+        self._RoundTrip('write_attributes')
+        for name, value in name_values:
+            self._Write(name, value)
+
+    def set_timeout_millis(self, timeout):
+        # NOTE: local setting of the proxy, not a round trip.
+        self.timeout = timeout / 1000.0
+
+    def status(self):
+        self._RoundTrip('status')
+        return self._Read('Status')
+
+    def subscribe_event(self, *args, **kwargs):
+        self._RoundTrip('subscribe_event')
+        PyTango.Except.throw_exception('API_EventPropertiesNotSet',
+                                       'Events are not simulated',
+                                       'FakeAlbaemDevice.subscribe_event')
+
+    def unsubscribe_event(self, event_id):
+        pass
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+
+"""
+Step scan benchmark of the AlbaEM# controller.
+
+The controller is driven through the same sequence of calls done by the
+pool for every point of a step scan, against simulated electrometers
+(see fake_albaem.py). The latency of every controller method and the nr
+of round trips to the electrometers per point are reported.
+
+With --continuous all the points are acquired with hardware triggers after
+only one start (time scan), reading the values while they arrive.
+
+Usage example::
+
+    python benchmarks/step_scan.py --points 100 --latency 0.001 \\
+        --electrometers 4 --buffer-size 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from albaemcotictrl import albaemcotictrl  # noqa: E402
+from fake_albaem import FakeAlbaemDevice  # noqa: E402
+
+__author__ = 'amilan'
+__docformat__ = 'restructuredtext'
+
+PERCENTILES = (50, 90, 99, 100)
+# Period (in s) of the readings in continuous mode, like the pool does
+READ_PERIOD = 0.01
+
+
+class StepScan(object):
+    """Run the pool call sequence of a step scan and time every call."""
+
+    def __init__(self, ctrl, devices, electrometers):
+        self.ctrl = ctrl
+        # NOTE: filled when the controller connects to the electrometers.
+        self.devices = devices
+        self.axes = range(1, 2 + 4 * electrometers)
+        # Duration of every call, by controller method.
+        self.durations = defaultdict(list)
+        # Round trips done in every point.
+        self.round_trips = []
+
+    def _Call(self, method, *args):
+        start = time.time()
+        result = getattr(self.ctrl, method)(*args)
+        self.durations[method].append(time.time() - start)
+        return result
+
+    def _TotalRoundTrips(self):
+        return sum(device.total_round_trips for device in self.devices)
+
+    def Point(self, integration_time):
+        round_trips = self._TotalRoundTrips()
+        start = time.time()
+        self._Call('PreLoadOne', 1, integration_time)
+        self._Call('LoadOne', 1, integration_time)
+        self._Call('PreStartAllCT')
+        for axis in self.axes:
+            self._Call('PreStartOneCT', axis)
+        self._Call('StartAllCT')
+        while True:
+            state = self._Call('StateAll')
+            for axis in self.axes:
+                self._Call('StateOne', axis)
+            if state != albaemcotictrl.State.Moving:
+                break
+        self._Call('PreReadAll')
+        self._Call('ReadAll')
+        for axis in self.axes:
+            self._Call('ReadOne', axis)
+        self.durations['point'].append(time.time() - start)
+        self.round_trips.append(self._TotalRoundTrips() - round_trips)
+
+    def Continuous(self, points, integration_time):
+        """Acquire all the points after only one start."""
+        round_trips = self._TotalRoundTrips()
+        start = time.time()
+        self._Call('setTriggerMode', 1, 'hardware')
+        self._Call('PreLoadOne', 1, integration_time)
+        self._Call('LoadOne', 1, integration_time, points)
+        self._Call('PreStartAllCT')
+        for axis in self.axes:
+            self._Call('PreStartOneCT', axis)
+        self._Call('StartAllCT')
+        nr_of_values = dict((axis, 0) for axis in self.axes)
+        while min(nr_of_values.values()) < points:
+            state = self._Call('StateAll')
+            self._Call('PreReadAll')
+            self._Call('ReadAll')
+            for axis in self.axes:
+                nr_of_values[axis] += len(self._Call('ReadOne', axis))
+            if state != albaemcotictrl.State.Moving:
+                break
+            time.sleep(READ_PERIOD)
+        self.durations['point'].append((time.time() - start) / points)
+        self.round_trips.append(
+            float(self._TotalRoundTrips() - round_trips) / points)
+        if min(nr_of_values.values()) != points:
+            print 'Values lost: {}'.format(nr_of_values)
+
+    def Report(self, integration_time):
+        header = '{:<16}{:>8}' + '{:>12}' * len(PERCENTILES)
+        print header.format('method', 'calls',
+                            *['p{} (ms)'.format(p) for p in PERCENTILES])
+        row = '{:<16}{:>8}' + '{:>12.3f}' * len(PERCENTILES)
+        for method, durations in sorted(self.durations.items()):
+            values = numpy.percentile(durations, PERCENTILES) * 1000
+            print row.format(method, len(durations), *values)
+        print
+        dead_time = numpy.mean(self.durations['point']) - integration_time
+        print 'Round trips per point: {0:.1f}'.format(
+            numpy.mean(self.round_trips))
+        print 'Dead time per point (ms): {0:.3f}'.format(dead_time * 1000)
+        round_trips = defaultdict(int)
+        for device in self.devices:
+            for access, count in device.round_trips.items():
+                round_trips[access] += count
+        print
+        print 'Round trips by access:'
+        for access, count in sorted(round_trips.items()):
+            print '    {0:<32}{1:>8}'.format(access, count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--points', type=int, default=100)
+    parser.add_argument('--integration-time', type=float, default=0.01,
+                        help='integration time per point (s)')
+    parser.add_argument('--electrometers', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='time spent in every round trip (s)')
+    parser.add_argument('--buffer-size', type=int, default=1,
+                        help='samples acquired per channel and point')
+    parser.add_argument('--as-string', action='store_true',
+                        help='give the buffers as strings')
+    parser.add_argument('--continuous', action='store_true',
+                        help='acquire all the points with hardware triggers')
+    parser.add_argument('--property', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='controller property, e.g. Prefetch=True')
+    args = parser.parse_args()
+
+    devices = []
+
+    # NOTE: the controller can create several proxies of the same device.
+    def device_proxy(name):
+        for device in devices:
+            if device.name == name:
+                return device
+        device = FakeAlbaemDevice(name, args.latency, args.buffer_size,
+                                  args.as_string)
+        devices.append(device)
+        return device
+
+    ctrl_class = albaemcotictrl.AlbaemCoTiCtrl
+    props = dict((name, info['DefaultValue'])
+                 for name, info in ctrl_class.ctrl_properties.items()
+                 if 'DefaultValue' in info)
+    props['Albaemname'] = ','.join('sim/albaem/{}'.format(i)
+                                   for i in range(1, args.electrometers + 1))
+    for prop in args.property:
+        name, value = prop.split('=', 1)
+        default = props.get(name)
+        if isinstance(default, bool):
+            value = value.lower() in ('1', 'true', 'yes')
+        elif default is not None:
+            value = type(default)(value)
+        props[name] = value
+
+    albaemcotictrl.PyTango.DeviceProxy = device_proxy
+    ctrl = ctrl_class('benchmark', props)
+    scan = StepScan(ctrl, devices, args.electrometers)
+    for axis in scan.axes:
+        ctrl.AddDevice(axis)
+    if args.continuous:
+        scan.Continuous(args.points, args.integration_time)
+    else:
+        for _ in range(args.points):
+            scan.Point(args.integration_time)
+    scan.Report(args.integration_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+
+"""
+Alignment of the channels in continuous mode, see AlbaemCoTiCtrl.ReadAll().
+
+The electrometers are simulated by benchmarks/fake_albaem.py, with one of
+the channels behind the others. Run it with::
+
+    python -m unittest discover tests
+"""
+
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir,
+                                'benchmarks'))
+
+from albaemcotictrl import albaemcotictrl  # noqa: E402
+from fake_albaem import FakeAlbaemDevice  # noqa: E402
+
+__docformat__ = 'restructuredtext'
+
+# Axes of one electrometer: the timer and its 4 channels
+AXES = range(1, 6)
+# Axis of the channel behind the others
+LAGGING_AXIS = 4
+
+
+class LaggingDevice(FakeAlbaemDevice):
+    """
+    Simulated electrometer whose triggers are given by the test, and whose
+    third channel gives its last `lag` samples late.
+    """
+
+    def __init__(self, name):
+        FakeAlbaemDevice.__init__(self, name)
+        self.lag = 0
+
+    def _Update(self):
+        pass
+
+    def Trigger(self, nr_of_triggers):
+        with self._lock:
+            self._Acquire(nr_of_triggers)
+
+    def Finish(self):
+        with self._lock:
+            self._start_time = None
+            self._acquired = True
+
+    def _Read(self, name):
+        value = FakeAlbaemDevice._Read(self, name)
+        if name == 'CurrentCh3' and self.lag:
+            return value[:-self.lag]
+        return value
+
+
+class AlignRowsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # NOTE: the connections are shared by name, so every test has its
+        # own device.
+        self.name = 'sim/albaem/{0}'.format(self.id().rsplit('.', 1)[-1])
+        self.device = LaggingDevice(self.name)
+        self._device_proxy = albaemcotictrl.PyTango.DeviceProxy
+        albaemcotictrl.PyTango.DeviceProxy = lambda name: self.device
+        ctrl_class = albaemcotictrl.AlbaemCoTiCtrl
+        props = dict((name, info['DefaultValue'])
+                     for name, info in ctrl_class.ctrl_properties.items()
+                     if 'DefaultValue' in info)
+        props['Albaemname'] = self.name
+        self.ctrl = ctrl_class('test', props)
+        for axis in AXES:
+            self.ctrl.AddDevice(axis)
+
+    def tearDown(self):
+        albaemcotictrl.PyTango.DeviceProxy = self._device_proxy
+
+    def _Start(self, repetitions):
+        self.ctrl.setTriggerMode(1, 'hardware')
+        self.ctrl.LoadOne(1, 0.01, repetitions)
+        self.ctrl.PreStartAllCT()
+        self.ctrl.StartAllCT()
+
+    def _ReadValues(self):
+        """Return the values given by every axis, like the pool does."""
+        self.ctrl.StateAll()
+        self.ctrl.ReadAll()
+        return dict((axis, self.ctrl.ReadOne(axis)) for axis in AXES)
+
+    def _AssertRows(self, values, nr_of_rows):
+        for axis in AXES:
+            self.assertEqual(len(values[axis]), nr_of_rows,
+                             'axis {0}: {1}'.format(axis, values[axis]))
+
+    def testLaggingChannelHoldsRows(self):
+        """The rows are given only when all the channels acquired them."""
+        self._Start(5)
+        self.device.Trigger(3)
+        self.device.lag = 2
+        self._AssertRows(self._ReadValues(), 1)
+        self.device.lag = 0
+        self.device.Trigger(1)
+        values = self._ReadValues()
+        self._AssertRows(values, 3)
+        for axis in AXES[1:]:
+            self.assertFalse(any(math.isnan(value)
+                                 for value in values[axis]))
+
+    def testLaggingChannelPaddedWhenOver(self):
+        """The samples still missing at the end are given as NaN."""
+        self._Start(5)
+        self.device.Trigger(4)
+        self.device.lag = 1
+        self._AssertRows(self._ReadValues(), 3)
+        self.device.Trigger(1)
+        self.device.Finish()
+        values = self._ReadValues()
+        self._AssertRows(values, 2)
+        self.assertTrue(math.isnan(values[LAGGING_AXIS][-1]))
+        self.assertFalse(math.isnan(values[LAGGING_AXIS][0]))
+        for axis in AXES[1:]:
+            if axis != LAGGING_AXIS:
+                self.assertFalse(any(math.isnan(value)
+                                     for value in values[axis]))
+        self._AssertRows(self._ReadValues(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()